@@ -0,0 +1,123 @@
+# Loads every image and sound once and keeps it around.
+# Images are cached by (name, size, scale), so asking for the same scaled sprite again costs a dictionary lookup.
+# Once a window exists the images are converted to the display's pixel format, which makes blitting them much faster.
+# preload() can do the loading up front, optionally on a background thread, so starting a game doesn't stall.
+# Nothing here initializes a pygame module before it is needed: the mixer is opened by the first sound() and the font
+# module by the first font().
+
+import os
+import threading
+
+import pygame
+
+# All the asset paths are relative to this directory. The folder is called "Assets", which matters on case-sensitive
+# file systems, so it is only spelled out here.
+ASSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Assets")
+
+images = {}  # (name, size, scale, alpha) -> (surface, whether it has been converted to the display format)
+sounds = {}  # name -> pygame.mixer.Sound, or None without an audio device
+fonts = {}  # size -> pygame.font.Font
+lock = threading.Lock()
+
+
+def path(name):
+    return os.path.join(ASSET_DIR, name)
+
+
+def exists(name):
+    return os.path.isfile(path(name))
+
+
+def display_ready():
+    return pygame.display.get_init() and pygame.display.get_surface() is not None
+
+
+# Whether the image is in the cache, without loading it
+def loaded(key):
+    with lock:
+        return tuple(key) in images
+
+
+# Returns the image scaled either to the given size in pixels or by the scale factor.
+# Images without transparency should pass alpha=False, they convert to a faster format.
+# convert=False skips the conversion, for loading on other threads.
+def image(name, size=None, scale=None, alpha=True, convert=True):
+    key = (name, size, scale, alpha)
+    convert = convert and display_ready()
+
+    with lock:
+        entry = images.get(key)
+
+    if entry is not None and (entry[1] or not convert):
+        return entry[0]
+
+    if entry is not None:
+        surface = entry[0]  # Loaded before the window existed, only needs converting
+    elif size is None and scale is None:
+        surface = pygame.image.load(path(name))
+    else:
+        original = image(name, alpha=alpha, convert=convert)
+        if size is None:
+            size = (int(original.get_width() * scale), int(original.get_height() * scale))
+        surface = pygame.transform.scale(original, size)
+
+    if convert:
+        surface = surface.convert_alpha() if alpha else surface.convert()
+
+    with lock:
+        images[key] = (surface, convert)
+
+    return surface
+
+
+# Returns None when there is no audio device
+def sound(name):
+    if name not in sounds:
+        if not pygame.mixer.get_init():
+            try:
+                pygame.mixer.init()
+            except pygame.error:
+                pass
+
+        sound = pygame.mixer.Sound(path(name)) if pygame.mixer.get_init() else None
+        with lock:
+            sounds[name] = sound
+
+    return sounds[name]
+
+
+# The default font in the given size
+def font(size):
+    if size not in fonts:
+        if not pygame.font.get_init():
+            pygame.font.init()
+
+        fonts[size] = pygame.font.Font(None, size)
+
+    return fonts[size]
+
+
+# Loads the given images and sounds into the cache. The images are (name, size, scale, alpha) tuples like the
+# arguments of image(). With background=True the loading happens on a daemon thread, which is returned.
+# The conversion to the display format is left to the first image() call on the main thread.
+def preload(image_keys=(), sound_names=(), background=False):
+    def load():
+        for key in image_keys:
+            image(*key, convert=not background)
+        for name in sound_names:
+            sound(name)
+
+    if not background:
+        load()
+        return None
+
+    thread = threading.Thread(target=load, name="asset-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def clear():
+    with lock:
+        images.clear()
+        sounds.clear()
+        fonts.clear()
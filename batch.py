@@ -0,0 +1,154 @@
+#! /usr/bin/python3
+# Runs many seeded headless games in parallel, one game per task on a process pool.
+# Meant for tuning the spawn settings and for regression runs over thousands of seeds. Every finished game is written
+# as one JSON line to the output file straight away, so the results never pile up in memory.
+#
+# Usage: python batch.py --runs N [--first-seed N] [--frames N] [--workers N] [--mode classic|endless|stress]
+#                        [--policy idle|random|FILE] [--set KEY=VALUE ...] [--output FILE]
+# A policy file holds a script for headless.scripted_policy(). --set overrides a value in the game state before the
+# game starts, e.g. --set max_circles=20 --set spawn_interval_decay=100.
+
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+import numpy
+
+import headless  # Sets up the dummy video and audio drivers before pygame is initialized
+import main
+import profiler
+import waves
+
+################################
+# Runs on the worker processes
+
+# The policy description is turned into a policy on the worker, because policies are closures and can't be pickled
+def make_policy(policy, seed):
+    if policy == "idle":
+        return headless.idle_policy
+    if policy == "random":
+        return headless.random_policy(seed)
+
+    return headless.scripted_policy(policy)  # The script itself
+
+
+# Plays one game and returns its stats
+def run_one(seed, frames, dt, substeps, policy, overrides, mode="classic"):
+    profiler.enable(history=frames)
+    profiler.reset()
+
+    result = headless.run(frames, seed, dt, substeps, make_policy(policy, seed),
+                          setup=lambda state: state.update(overrides), mode=mode)
+
+    # The time the game code took on every frame, from the profiler
+    frame_times = numpy.array([frame["total"] for frame in profiler.frames] or [0])
+
+    result["collisions"] = sum(frame.get("collisions", 0) for frame in profiler.frames)
+    result["frame_ms"] = {
+        "mean": float(frame_times.mean()),
+        "p50": float(numpy.percentile(frame_times, 50)),
+        "p95": float(numpy.percentile(frame_times, 95)),
+        "p99": float(numpy.percentile(frame_times, 99)),
+        "max": float(frame_times.max())
+    }
+
+    return result
+
+################################
+
+# Runs the given seeds on a process pool and writes every result as a JSON line to the file as soon as it's done.
+# At most a few tasks per worker are queued at a time, so the seeds can be any iterable, however long.
+# Returns the averages over all the runs, which are kept as running totals.
+def run_batch(seeds, file, frames=3600, dt=main.SIMULATION_DT, substeps=1, policy="idle", overrides=None, workers=None,
+              log=None, mode="classic"):
+    workers = workers or os.cpu_count() or 1
+    overrides = overrides or {}
+    seeds = iter(seeds)
+
+    summary = {"runs": 0, "game_over": 0, "score": 0, "survival_time": 0, "collisions": 0}
+    pending = set()
+
+    def submit():
+        seed = next(seeds, None)
+        if seed is None:
+            return False
+
+        pending.add(executor.submit(run_one, seed, frames, dt, substeps, policy, overrides, mode))
+        return True
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        while len(pending) < 2 * workers and submit():
+            pass
+
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for future in done:
+                pending.remove(future)
+                result = future.result()
+
+                file.write(json.dumps(result) + "\n")
+                file.flush()
+
+                summary["runs"] += 1
+                summary["game_over"] += result["game_over"]
+                for key in ("score", "survival_time", "collisions"):
+                    summary[key] += result[key]
+
+                if log is not None:
+                    log(f"seed {result['seed']}: score {result['score']}, survived {result['survival_time']:.1f} s, "
+                        f"p95 frame {result['frame_ms']['p95']:.2f} ms")
+
+                submit()
+
+    # Totals into averages
+    for key in ("score", "survival_time", "collisions"):
+        summary[key] = summary[key] / summary["runs"] if summary["runs"] else 0
+
+    return summary
+
+
+# "key=value" into (key, value), with the value parsed as JSON when it can be
+def parse_override(text):
+    key, value = text.split("=", 1)
+
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many headless games in parallel")
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--frames", type=int, default=3600)
+    parser.add_argument("--substeps", type=int, default=1)
+    parser.add_argument("--dt", type=float, default=main.SIMULATION_DT)
+    parser.add_argument("--workers", type=int, help="How many processes to use, all the CPUs by default")
+    parser.add_argument("--mode", choices=waves.MODES, default="classic", help="How the asteroids are spawned")
+    parser.add_argument("--policy", default="idle", help="idle, random or a JSON file with an input script")
+    parser.add_argument("--set", action="append", default=[], type=parse_override, metavar="KEY=VALUE",
+                        help="Override a game state value, e.g. max_circles=20")
+    parser.add_argument("--output", default="batch_results.jsonl", help="Where to write the results, one line per run")
+    args = parser.parse_args()
+
+    policy = args.policy
+    if policy not in ("idle", "random"):
+        with open(policy) as file:
+            policy = json.load(file)
+
+    start_time = time.perf_counter()
+
+    with open(args.output, "w") as file:
+        summary = run_batch(range(args.first_seed, args.first_seed + args.runs), file, args.frames, args.dt,
+                            args.substeps, policy, dict(args.set), args.workers,
+                            log=lambda line: print(line, file=sys.stderr), mode=args.mode)
+
+    summary["wall_time"] = time.perf_counter() - start_time
+
+    for key, value in summary.items():
+        print(f"{key}: {value}")
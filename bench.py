@@ -0,0 +1,286 @@
+#! /usr/bin/python3
+# Benchmarks for the physics and game rule hot paths.
+# Every stage is timed over a range of object counts, colliders per object and substeps and the results are written as
+# JSON, so that runs from different commits can be compared with --compare.
+#
+# --startup times starting the game instead, each repeat in a fresh interpreter: importing physics, importing main,
+# showing the first intro frame and having all the streamed images loaded, every one counted from before the imports.
+#
+# Usage: python bench.py [--counts 10 100 1000 10000] [--colliders 1 4] [--substeps 1 2 4] [--repeats 7] [--output FILE]
+#        python bench.py --startup [--repeats 7] [--output FILE]
+#        python bench.py --compare OLD.json NEW.json [--threshold 1.1]
+
+import argparse
+import collections
+import json
+import math
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy
+import pygame
+
+import colliders
+import headless  # Sets up the dummy video and audio drivers before pygame is initialized
+import main
+import physics
+import world
+
+# Every object gets about this much room, the play area grows with the object count so the density stays the same
+AREA_PER_OBJECT = 6000
+
+################################
+# Scenes
+
+def scene_size(count):
+    side = math.sqrt(max(count, 100) * AREA_PER_OBJECT / (4 / 3))
+    return int(side * 4 / 3), int(side)
+
+# A world of asteroids made of several circles each, moving in random directions
+def make_world(count, collider_count, seed=0):
+    rng = random.Random(seed)
+    width, height = scene_size(count)
+    objects = world.World()
+
+    for i in range(count):
+        r = rng.uniform(8, 25)
+        objects.add({
+            "position": pygame.Vector2(rng.uniform(r, width - r), rng.uniform(r, height - r)),
+            "velocity": pygame.Vector2(rng.uniform(-200, 200), rng.uniform(-200, 200)),
+            "mass": r**3,
+            "radius": r,
+            "colliders": [{"position": pygame.Vector2(r / 2, 0).rotate(360 * i / collider_count) if collider_count > 1
+                           else pygame.Vector2(0, 0),
+                           "radius": r / 2 if collider_count > 1 else r} for i in range(collider_count)]
+        })
+
+    return objects, pygame.Rect(0, 0, width, height)
+
+# A running game with the given number of asteroids and some bullets in the air
+def make_game(count, seed=0):
+    state = headless.start(seed)
+    rng = random.Random(seed)
+    width, height = scene_size(count)
+
+    # The asteroids are kept away from the player so the game doesn't end immediately
+    player = state["objects"][state["player_uid"]]
+    player["position"] = pygame.Vector2(width / 2, height / 2)
+    player["image_rect"].center = player["position"]
+
+    for i in range(count):
+        r = rng.randrange(10, 30)
+        position = pygame.Vector2(rng.uniform(r, width - r), rng.uniform(r, height - r))
+        if (position - player["position"]).length() < 150:
+            position.y = r
+
+        state["objects"].add({
+            "position": position,
+            "velocity": pygame.Vector2(rng.uniform(-100, 100), rng.uniform(50, 200)),
+            "mass": r**3,
+            "radius": r,
+            "colliders": [colliders.circle(r)],
+            "color": rng.choice(main.colors),
+            "tag": "asteroid"
+        })
+
+    # About as many bullets as sustained fire keeps on the screen
+    for i in range(min(max(count // 10, 1), 50)):
+        main.fire_bullet()
+        bullet = state["bullets"][-1]
+        bullet["position"] = pygame.Vector2(rng.uniform(0, width), rng.uniform(0, height))
+        bullet["rect"].center = bullet["position"]
+
+    state["index"] = physics.buildIndex(state["objects"], state["dt"])
+    return state
+
+################################
+# Measuring
+
+# Runs setup() and then stage() on its result `repeats` times, timing only stage().
+# Allocations are measured on one extra run, because tracemalloc slows everything down.
+def measure(setup, stage, repeats):
+    times = []
+
+    for i in range(repeats):
+        args = setup()
+        start = time.perf_counter()
+        stage(args)
+        times.append(time.perf_counter() - start)
+
+    args = setup()
+    tracemalloc.start()
+    stage(args)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times.sort()
+    return {
+        "median_ms": statistics.median(times) * 1000,
+        "p95_ms": times[min(len(times) - 1, math.ceil(0.95 * len(times)) - 1)] * 1000,
+        "min_ms": times[0] * 1000,
+        "repeats": repeats,
+        "alloc_peak_bytes": peak,
+        "alloc_net_bytes": current
+    }
+
+def run_benchmarks(counts, collider_counts, substep_counts, repeats, log=print):
+    results = []
+
+    def record(stage, params, setup, function):
+        result = {"stage": stage, **params, **measure(setup, function, repeats)}
+        results.append(result)
+        log(f"{stage:28} {json.dumps(params):48} median {result['median_ms']:10.3f} ms   p95 {result['p95_ms']:10.3f} ms")
+
+    for count in counts:
+        for collider_count in collider_counts:
+            params = {"objects": count, "colliders": collider_count}
+            objects, bounds = make_world(count, collider_count)
+            collisions = physics.findObjectCollisions(objects) + physics.findBoundaryCollisions(objects, bounds)
+
+            record("findObjectCollisions", params, lambda: objects, physics.findObjectCollisions)
+            record("findBoundaryCollisions", params, lambda: objects,
+                   lambda objects: physics.findBoundaryCollisions(objects, bounds))
+            record("solveCollision", params, lambda: collisions,
+                   lambda collisions: [physics.solveCollision(collision) for collision in collisions])
+
+            for substeps in substep_counts:
+                record("physics.update", {**params, "substeps": substeps},
+                       lambda: make_world(count, collider_count),
+                       lambda scene: [physics.update(main.SIMULATION_DT / substeps, scene[0], scene[1], None)
+                                      for i in range(substeps)])
+
+        params = {"objects": count}
+        record("handle_bullet_collisions", params, lambda: make_game(count), lambda state: main.handle_bullet_collisions())
+        record("check_player_collision", params, lambda: make_game(count), lambda state: main.check_player_collision())
+
+    return results
+
+################################
+# Startup
+
+# Run in a new interpreter for every repeat, prints the times in seconds as JSON. The video and audio drivers are the
+# dummy ones set up by headless.py, which the child process inherits.
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+times = {}
+
+if sys.argv[1] == "physics":
+    import physics
+    times["import_physics"] = time.perf_counter() - start
+else:
+    import main, rendering
+    times["import_main"] = time.perf_counter() - start
+
+    state = main.start_up()
+    main.update_streamed_assets()
+    main.draw()
+    rendering.present(state["renderer"])
+    times["first_frame"] = time.perf_counter() - start
+
+    state["asset_loader"].join()
+    main.update_streamed_assets()
+    times["assets_loaded"] = time.perf_counter() - start
+
+print(json.dumps(times))
+"""
+
+def run_startup_benchmarks(repeats, log=print):
+    times = collections.defaultdict(list)
+
+    for i in range(repeats):
+        for target in ("physics", "main"):
+            output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, target], check=True, capture_output=True,
+                                    text=True).stdout
+            for stage, seconds in json.loads(output.splitlines()[-1]).items():
+                times[stage].append(seconds)
+
+    results = []
+    for stage, samples in times.items():
+        samples.sort()
+        result = {
+            "stage": f"startup.{stage}",
+            "median_ms": statistics.median(samples) * 1000,
+            "p95_ms": samples[min(len(samples) - 1, math.ceil(0.95 * len(samples)) - 1)] * 1000,
+            "min_ms": samples[0] * 1000,
+            "repeats": repeats
+        }
+        results.append(result)
+        log(f"{result['stage']:28} median {result['median_ms']:10.3f} ms   p95 {result['p95_ms']:10.3f} ms")
+
+    return results
+
+################################
+# Comparing
+
+# Prints how every stage changed between two result files and returns the stages that got slower than the threshold
+def compare(old_path, new_path, threshold):
+    with open(old_path) as file:
+        old = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+
+    def key(result):
+        return tuple(sorted((name, value) for name, value in result.items()
+                            if name in ("stage", "objects", "colliders", "substeps")))
+
+    old_results = {key(result): result for result in old["results"]}
+    regressions = []
+
+    for result in new["results"]:
+        before = old_results.get(key(result))
+        if before is None:
+            continue
+
+        ratio = result["median_ms"] / before["median_ms"] if before["median_ms"] > 0 else float("inf")
+        marker = "  <-- slower" if ratio > threshold else ""
+        print(f"{dict(key(result))}: {before['median_ms']:.3f} -> {result['median_ms']:.3f} ms ({ratio:.2f}x){marker}")
+
+        if ratio > threshold:
+            regressions.append(result)
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the physics and game rule hot paths")
+    parser.add_argument("--counts", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--colliders", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--substeps", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument("--startup", action="store_true", help="Time starting the game instead of the hot paths")
+    parser.add_argument("--output", help="Where to write the JSON results, stdout if not given")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files instead")
+    parser.add_argument("--threshold", type=float, default=1.1, help="Slowdown ratio counted as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(args.compare[0], args.compare[1], args.threshold) else 0)
+
+    log = lambda line: print(line, file=sys.stderr)
+    if args.startup:
+        results = run_startup_benchmarks(args.repeats, log)
+    else:
+        results = run_benchmarks(args.counts, args.colliders, args.substeps, args.repeats, log)
+
+    output = {
+        "meta": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "numpy": numpy.__version__,
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        "results": results
+    }
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(output, file, indent=1)
+    else:
+        json.dump(output, sys.stdout, indent=1)
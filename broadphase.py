@@ -0,0 +1,302 @@
+# Broadphase collision detection.
+# Finds pairs of objects whose bounding boxes overlap, so the narrowphase in physics.py only has to look at those
+# instead of every possible pair.
+
+# Every function takes a list of bounding boxes (minX, minY, maxX, maxY) and returns a sorted list of index pairs (i, j)
+# with i < j. Each unordered pair is reported once. The sorting makes the output match the order the brute force
+# all-pairs loop visits the pairs in, which matters because collisions are resolved one after another.
+
+import numpy
+
+
+def overlaps(box1, box2):
+    return box1[0] <= box2[2] and box2[0] <= box1[2] and box1[1] <= box2[3] and box2[1] <= box1[3]
+
+
+def findPairsBruteForce(boxes):
+    pairs = []
+
+    for i in range(len(boxes)):
+        for j in range(i + 1, len(boxes)):
+            if overlaps(boxes[i], boxes[j]):
+                pairs.append((i, j))
+
+    return pairs
+
+
+# Uniform grid / spatial hash. Every box is inserted into all the cells it touches and only boxes sharing a cell are
+# tested against each other. Works best when the cell size is around the size of a typical object.
+def findPairsSpatialHash(boxes, cellSize=None):
+    if len(boxes) < 2:
+        return []
+
+    grid = buildGrid(boxes, cellSize)
+
+    # The same pair can share several cells, hence the set
+    pairs = set()
+
+    for cell in grid["cells"].values():
+        for a in range(len(cell)):
+            i = cell[a]
+            for b in range(a + 1, len(cell)):
+                j = cell[b]
+                if (i, j) not in pairs and overlaps(boxes[i], boxes[j]):
+                    pairs.add((i, j))
+
+    # Cells are filled in index order, so i < j always holds
+    return sorted(pairs)
+
+
+def getCellRange(box, cellSize):
+    return range(int(box[0] // cellSize), int(box[2] // cellSize) + 1), \
+        range(int(box[1] // cellSize), int(box[3] // cellSize) + 1)
+
+
+# A spatial hash that can be queried with any box, e.g. for finding the asteroids a bullet might hit
+def buildGrid(boxes, cellSize=None):
+    if cellSize is None:
+        cellSize = estimateCellSize(boxes) if boxes else 1
+
+    cells = {}
+
+    for i, box in enumerate(boxes):
+        rangeX, rangeY = getCellRange(box, cellSize)
+        for cellX in rangeX:
+            for cellY in rangeY:
+                cell = cells.get((cellX, cellY))
+                if cell is None:
+                    cells[(cellX, cellY)] = [i]
+                else:
+                    cell.append(i)
+
+    return {"boxes": boxes, "cellSize": cellSize, "cells": cells}
+
+
+# Adds a box to a grid made by buildGrid() and returns its index
+def insertGrid(grid, box):
+    i = len(grid["boxes"])
+    grid["boxes"].append(box)
+
+    rangeX, rangeY = getCellRange(box, grid["cellSize"])
+    for cellX in rangeX:
+        for cellY in rangeY:
+            grid["cells"].setdefault((cellX, cellY), []).append(i)
+
+    return i
+
+
+# Grows box i of a grid made by buildGrid() to the given box, which has to contain the old one
+def growGrid(grid, i, box):
+    oldX, oldY = getCellRange(grid["boxes"][i], grid["cellSize"])
+    grid["boxes"][i] = box
+
+    rangeX, rangeY = getCellRange(box, grid["cellSize"])
+    for cellX in rangeX:
+        for cellY in rangeY:
+            if cellX not in oldX or cellY not in oldY:
+                grid["cells"].setdefault((cellX, cellY), []).append(i)
+
+
+# Indices of the boxes in the grid that overlap the given box, in ascending order
+def queryGrid(grid, box):
+    rangeX, rangeY = getCellRange(box, grid["cellSize"])
+    found = set()
+
+    for cellX in rangeX:
+        for cellY in rangeY:
+            for i in grid["cells"].get((cellX, cellY), ()):
+                if i not in found and overlaps(grid["boxes"][i], box):
+                    found.add(i)
+
+    return sorted(found)
+
+
+# Sort and sweep along the x axis. Boxes are sorted by their left edge and every box is only tested against the boxes
+# whose x range it still overlaps.
+def findPairsSortAndSweep(boxes):
+    order = sorted(range(len(boxes)), key=lambda index: boxes[index][0])
+    active = []
+    pairs = []
+
+    for i in order:
+        box = boxes[i]
+
+        # Drop the boxes that end before this one starts, they can't overlap anything after it either
+        active = [j for j in active if boxes[j][2] >= box[0]]
+
+        for j in active:
+            if box[1] <= boxes[j][3] and boxes[j][1] <= box[3]:
+                pairs.append((j, i) if j < i else (i, j))
+
+        active.append(i)
+
+    pairs.sort()
+    return pairs
+
+
+# Twice the average box size keeps most objects in at most four cells
+def estimateCellSize(boxes):
+    total = 0
+
+    for box in boxes:
+        total += max(box[2] - box[0], box[3] - box[1])
+
+    return max(2 * total / len(boxes), 1)
+
+
+METHODS = {
+    "bruteforce": findPairsBruteForce,
+    "grid": findPairsSpatialHash,
+    "sweep": findPairsSortAndSweep
+}
+
+
+def findPairs(boxes, method="grid"):
+    if method not in METHODS:
+        raise ValueError(f"Unknown broadphase method '{method}', expected one of {list(METHODS)}")
+
+    return METHODS[method](boxes)
+
+
+################################
+# The same for boxes in an (n, 4) NumPy array, returning the pairs as two arrays of indices, sorted the same way.
+# Everything is done in array operations, so a world.World can find its pairs without going through them one by one.
+
+def overlapsArray(boxes1, boxes2):
+    return (boxes1[:, 0] <= boxes2[:, 2]) & (boxes2[:, 0] <= boxes1[:, 2]) & \
+        (boxes1[:, 1] <= boxes2[:, 3]) & (boxes2[:, 1] <= boxes1[:, 3])
+
+
+# Every position k paired with the positions from starts[k] up to ends[k], exclusive
+def expandRanges(starts, ends):
+    counts = numpy.maximum(ends - starts, 0)
+    first = numpy.repeat(numpy.arange(len(ends)), counts)
+    offsets = numpy.arange(len(first)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    return first, numpy.repeat(starts, counts) + offsets
+
+
+# The pairs with the lower index first, sorted and without duplicates
+def sortPairs(first, second, n):
+    keys = numpy.unique(numpy.minimum(first, second) * n + numpy.maximum(first, second))
+    return keys // n, keys % n
+
+
+def findPairsBruteForceArray(boxes):
+    first, second = numpy.triu_indices(len(boxes), 1)
+    keep = overlapsArray(boxes[first], boxes[second])
+    return first[keep], second[keep]
+
+
+# Every cell each box touches, as the index of the box and the x and y of the cell
+def getCellsArray(boxes, cellSize):
+    low = (boxes[:, :2] // cellSize).astype(numpy.int64)
+    high = (boxes[:, 2:] // cellSize).astype(numpy.int64)
+    span = high - low + 1
+    cellCounts = span[:, 0] * span[:, 1]
+
+    box = numpy.repeat(numpy.arange(len(boxes)), cellCounts)
+    k = numpy.arange(len(box)) - numpy.repeat(numpy.cumsum(cellCounts) - cellCounts, cellCounts)
+    return box, low[box, 0] + k % span[box, 0], low[box, 1] + k // span[box, 0]
+
+
+# Every box goes into all the cells it touches, the cells are sorted and every box is paired with the boxes after it in
+# the same cell
+def findPairsSpatialHashArray(boxes, cellSize=None):
+    n = len(boxes)
+    if n < 2:
+        return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+
+    if cellSize is None:
+        cellSize = max(2 * float(numpy.sum(numpy.maximum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]))) / n, 1)
+
+    box, cellX, cellY = getCellsArray(boxes, cellSize)
+    cell = (cellX - cellX.min()) * (cellY.max() - cellY.min() + 1) + cellY - cellY.min()
+    order = numpy.lexsort((box, cell))
+    cell = cell[order]
+    box = box[order]
+
+    first, second = expandRanges(numpy.arange(1, len(cell) + 1), numpy.searchsorted(cell, cell, side="right"))
+    first = box[first]
+    second = box[second]
+    keep = overlapsArray(boxes[first], boxes[second])
+
+    # The same pair can share several cells
+    return sortPairs(first[keep], second[keep], n)
+
+
+# Sorted by the left edge, every box is paired with the boxes that start before it ends
+def findPairsSortAndSweepArray(boxes):
+    order = numpy.argsort(boxes[:, 0], kind="stable")
+    first, second = expandRanges(numpy.arange(1, len(boxes) + 1),
+                                 numpy.searchsorted(boxes[order, 0], boxes[order, 2], side="right"))
+    first = order[first]
+    second = order[second]
+    keep = (boxes[first, 1] <= boxes[second, 3]) & (boxes[second, 1] <= boxes[first, 3])
+
+    return sortPairs(first[keep], second[keep], len(boxes))
+
+
+ARRAY_METHODS = {
+    "bruteforce": findPairsBruteForceArray,
+    "grid": findPairsSpatialHashArray,
+    "sweep": findPairsSortAndSweepArray
+}
+
+
+def findPairsArray(boxes, method="grid"):
+    if method not in ARRAY_METHODS:
+        raise ValueError(f"Unknown broadphase method '{method}', expected one of {list(ARRAY_METHODS)}")
+
+    return ARRAY_METHODS[method](boxes)
+
+
+# The overlapping pairs of a query box and a box, for many query boxes at once, as two arrays of indices.
+# Sorted by the left edge, only the boxes starting between the query's left edge minus the widest box and its right
+# edge are tested.
+def queryManyArray(boxes, queries):
+    order = numpy.argsort(boxes[:, 0], kind="stable")
+    left = boxes[order, 0]
+    width = float(numpy.max(boxes[:, 2] - boxes[:, 0])) if len(boxes) else 0
+
+    query, box = expandRanges(numpy.searchsorted(left, queries[:, 0] - width, side="left"),
+                              numpy.searchsorted(left, queries[:, 2], side="right"))
+    box = order[box]
+    keep = overlapsArray(queries[query], boxes[box])
+    return query[keep], box[keep]
+
+
+# The same with a grid, for query boxes that are spread out along both axes. The boxes are put into the cells they touch
+# and every query box is only tested against the boxes in its own cells.
+def queryManyGridArray(boxes, queries, cellSize):
+    if len(boxes) == 0 or len(queries) == 0:
+        return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+
+    box, boxX, boxY = getCellsArray(boxes, cellSize)
+    query, queryX, queryY = getCellsArray(queries, cellSize)
+
+    # The same cell gets the same key for both
+    minX = min(boxX.min(), queryX.min())
+    minY = min(boxY.min(), queryY.min())
+    height = max(boxY.max(), queryY.max()) - minY + 1
+    boxCell = (boxX - minX) * height + boxY - minY
+    queryCell = (queryX - minX) * height + queryY - minY
+
+    order = numpy.argsort(boxCell, kind="stable")
+    boxCell = boxCell[order]
+    box = box[order]
+
+    first, second = expandRanges(numpy.searchsorted(boxCell, queryCell, side="left"),
+                                 numpy.searchsorted(boxCell, queryCell, side="right"))
+    query = query[first]
+    box = box[second]
+    keep = overlapsArray(queries[query], boxes[box])
+
+    # A query and a box can share several cells
+    keys = numpy.unique(query[keep] * len(boxes) + box[keep])
+    return keys // len(boxes), keys % len(boxes)
+
+
+# Indices of the boxes that overlap the given box, in ascending order
+def queryArray(boxes, box):
+    return numpy.flatnonzero((boxes[:, 0] <= box[2]) & (box[0] <= boxes[:, 2]) &
+                             (boxes[:, 1] <= box[3]) & (box[1] <= boxes[:, 3]))
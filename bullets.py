@@ -0,0 +1,63 @@
+# A pool of bullet dictionaries that are reused instead of created for every shot.
+# The live bullets are always the first len(pool) entries. Removing a bullet moves the last live one into its place,
+# so removal is O(1) but doesn't keep the order, which nothing depends on.
+
+import pygame
+
+
+def new_bullet():
+    return {
+        "position": pygame.Vector2(0, 0),
+        "velocity": pygame.Vector2(0, 0),
+        "image": None,
+        "rect": pygame.Rect(0, 0, 0, 0),
+        "drawn": False,
+        "marked_for_removal": False
+    }
+
+
+class BulletPool:
+    def __init__(self, capacity=32):
+        self.bullets = [new_bullet() for i in range(capacity)]
+        self.count = 0
+
+    def spawn(self, image, position, velocity):
+        if self.count == len(self.bullets):
+            self.bullets += [new_bullet() for i in range(len(self.bullets))]
+
+        bullet = self.bullets[self.count]
+        self.count += 1
+
+        bullet["position"].update(position)
+        bullet["velocity"].update(velocity)
+        bullet["image"] = image
+        bullet["rect"].size = image.get_size()
+        bullet["rect"].center = position
+        bullet["drawn"] = False
+        bullet["marked_for_removal"] = False
+
+        return bullet
+
+    # Swaps the last live bullet into the given index
+    def remove(self, index):
+        last = self.count - 1
+        self.bullets[index], self.bullets[last] = self.bullets[last], self.bullets[index]
+        self.count = last
+
+    def clear(self):
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self.bullets[i]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("bullet index out of range")
+
+        return self.bullets[index]
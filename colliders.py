@@ -0,0 +1,139 @@
+# Collider shapes and the overlap tests between them.
+# An object has a list of colliders in obj["colliders"]. Every collider is a dictionary with a "type" and a "position"
+# relative to the object's position:
+#   {"type": "circle", "position": Vector2, "radius": r}
+#   {"type": "aabb", "position": Vector2, "size": Vector2(width, height)}  # Axis aligned box, position is its center
+# Colliders without a type are circles, which is what physics.py used before there were other shapes.
+
+import math
+
+import pygame
+
+
+def circle(radius, offset=(0, 0)):
+    return {"type": "circle", "position": pygame.Vector2(offset), "radius": radius}
+
+
+def aabb(width, height, offset=(0, 0)):
+    return {"type": "aabb", "position": pygame.Vector2(offset), "size": pygame.Vector2(width, height)}
+
+
+def isCircle(collider):
+    return collider.get("type", "circle") == "circle"
+
+
+# (minX, minY, maxX, maxY) of a collider on an object at the given position
+def getBounds(collider, position):
+    center = position + collider["position"]
+
+    if isCircle(collider):
+        r = collider["radius"]
+        return center.x - r, center.y - r, center.x + r, center.y + r
+
+    halfW = collider["size"].x / 2
+    halfH = collider["size"].y / 2
+    return center.x - halfW, center.y - halfH, center.x + halfW, center.y + halfH
+
+
+# Bounds around all the colliders of an object
+def getObjectBounds(colliderList, position):
+    minX = minY = float("inf")
+    maxX = maxY = float("-inf")
+
+    for collider in colliderList:
+        bounds = getBounds(collider, position)
+        minX = min(minX, bounds[0])
+        minY = min(minY, bounds[1])
+        maxX = max(maxX, bounds[2])
+        maxY = max(maxY, bounds[3])
+
+    return minX, minY, maxX, maxY
+
+
+# How much the first collider has to move to get out of the second one, split evenly between the two like the
+# circle-circle case always was. None if they don't overlap.
+def getDisplacement(collider1, position1, collider2, position2):
+    circle1 = isCircle(collider1)
+    circle2 = isCircle(collider2)
+
+    if circle1 and circle2:
+        return getDisplacementCircleCircle(position1 + collider1["position"], collider1["radius"],
+                                           position2 + collider2["position"], collider2["radius"])
+    if circle1:
+        return getDisplacementCircleBox(position1 + collider1["position"], collider1["radius"],
+                                        getBounds(collider2, position2))
+    if circle2:
+        displacement = getDisplacementCircleBox(position2 + collider2["position"], collider2["radius"],
+                                                getBounds(collider1, position1))
+        return None if displacement is None else -displacement
+
+    return getDisplacementBoxBox(getBounds(collider1, position1), getBounds(collider2, position2))
+
+
+def overlaps(collider1, position1, collider2, position2):
+    if isCircle(collider1) and isCircle(collider2):
+        pos1 = position1 + collider1["position"]
+        pos2 = position2 + collider2["position"]
+        return (pos1 - pos2).length_squared() < (collider1["radius"] + collider2["radius"]) ** 2
+
+    return getDisplacement(collider1, position1, collider2, position2) is not None
+
+
+# Whether any collider of one object overlaps any collider of the other
+def objectsOverlap(colliders1, position1, colliders2, position2):
+    for collider1 in colliders1:
+        for collider2 in colliders2:
+            if overlaps(collider1, position1, collider2, position2):
+                return True
+
+    return False
+
+################################
+
+# Written with the same operations as physics.findWorldCollisions(), which does this for many circles at once, so both
+# give the same results to the last bit
+def getDisplacementCircleCircle(pos1, r1, pos2, r2):
+    difference = pos1 - pos2
+    distanceSquared = difference.length_squared()
+
+    if distanceSquared >= (r1 + r2) * (r1 + r2):
+        return None
+
+    distance = math.sqrt(distanceSquared)
+    if distance == 0:
+        return pygame.Vector2(0, -(r1 + r2) / 2)  # Exactly on top of each other, pick a direction
+
+    return difference / distance * (r1 + r2 - distance) / 2
+
+
+def getDisplacementCircleBox(center, r, box):
+    closest = pygame.Vector2(max(box[0], min(center.x, box[2])), max(box[1], min(center.y, box[3])))
+    difference = center - closest
+    distanceSquared = difference.length_squared()
+
+    if distanceSquared >= r * r:
+        return None
+
+    if distanceSquared > 0:
+        distance = distanceSquared ** 0.5
+        return difference / distance * (r - distance) / 2
+
+    # The center is inside the box, push out through the nearest side
+    pushes = [pygame.Vector2(box[0] - center.x - r, 0), pygame.Vector2(box[2] - center.x + r, 0),
+              pygame.Vector2(0, box[1] - center.y - r), pygame.Vector2(0, box[3] - center.y + r)]
+    return min(pushes, key=lambda push: push.length_squared()) / 2
+
+
+def getDisplacementBoxBox(box1, box2):
+    overlapX = min(box1[2], box2[2]) - max(box1[0], box2[0])
+    overlapY = min(box1[3], box2[3]) - max(box1[1], box2[1])
+
+    if overlapX <= 0 or overlapY <= 0:
+        return None
+
+    if overlapX < overlapY:
+        direction = 1 if box1[0] + box1[2] > box2[0] + box2[2] else -1
+        return pygame.Vector2(direction * overlapX / 2, 0)
+
+    direction = 1 if box1[1] + box1[3] > box2[1] + box2[3] else -1
+    return pygame.Vector2(0, direction * overlapY / 2)
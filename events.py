@@ -0,0 +1,73 @@
+# A buffer for the collisions between objects, filled by physics.update() and drained by the game once per frame.
+# It replaces posting a pygame event for every contact, which fills up the SDL event queue under heavy collision load
+# and delays the input events that share it.
+# The pairs are kept in a preallocated array of UIDs. A pair is only recorded once until the next drain, so contacts
+# that last several substeps don't repeat.
+
+import numpy
+
+
+class CollisionBuffer:
+    def __init__(self, capacity=256):
+        self.pairs = numpy.zeros((capacity, 2), dtype=numpy.int64)
+        self.count = 0
+        self.seen = set()  # The pairs recorded since the last drain, smaller UID first
+        self.subscribers = {}  # tag -> callbacks
+
+    def add(self, uid1, uid2):
+        pair = (uid1, uid2) if uid1 < uid2 else (uid2, uid1)
+        if pair in self.seen:
+            return
+
+        if self.count == len(self.pairs):
+            self.pairs = numpy.concatenate((self.pairs, numpy.zeros_like(self.pairs)))
+
+        self.seen.add(pair)
+        self.pairs[self.count] = pair
+        self.count += 1
+
+    # Adds the object-object collisions of physics.update(), walls (uid -1) are skipped
+    def extend(self, collisions):
+        for collision in collisions:
+            uid1 = collision[0]["uid"]
+            uid2 = collision[1]["uid"]
+            if uid1 >= 0 and uid2 >= 0:
+                self.add(uid1, uid2)
+
+    # callback(uid, otherUid) is called on every drain for each recorded collision of an object with the given tag.
+    # When both objects have the tag, it's called for both of them.
+    def subscribe(self, tag, callback):
+        self.subscribers.setdefault(tag, []).append(callback)
+
+    def unsubscribe(self, tag, callback):
+        self.subscribers[tag].remove(callback)
+
+    # Calls the subscribers for every recorded collision and empties the buffer.
+    # Objects that have been removed from the objects since the collision are skipped.
+    def drain(self, objects):
+        pairs = self.pairs[:self.count].tolist()
+        self.clear()
+
+        if not self.subscribers:
+            return pairs
+
+        for uid1, uid2 in pairs:
+            for uid, other in ((uid1, uid2), (uid2, uid1)):
+                if uid not in objects:
+                    continue
+
+                for callback in self.subscribers.get(objects[uid].get("tag"), ()):
+                    callback(uid, other)
+
+        return pairs
+
+    def clear(self):
+        self.count = 0
+        self.seen.clear()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield int(self.pairs[i, 0]), int(self.pairs[i, 1])
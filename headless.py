@@ -0,0 +1,155 @@
+#! /usr/bin/python3
+# Runs the game without a window or sound, with a fixed timestep and as fast as the CPU allows.
+# Useful for soak tests and benchmarks. A run is fully determined by its seed, timestep, substeps and input policy.
+#
+# Usage: python headless.py [--frames N] [--seed N] [--substeps N] [--dt SECONDS] [--mode classic|endless|stress]
+#                           [--random-input] [--profile FILE] [--snapshot FILE] [--save-snapshot FILE]
+
+import argparse
+import collections
+import os
+import random
+import time
+
+# Must be set before pygame is initialized
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+import main
+import profiler
+import snapshot
+import waves
+
+################################
+# Input policies
+# A policy is called once per frame with the frame number and the state and returns the pressed keys and whether to
+# fire a bullet this frame.
+
+def idle_policy(frame, state):
+    return {}, False
+
+# Holds a random direction for a while and fires now and then
+def random_policy(seed):
+    rng = random.Random(seed)
+    directions = [(), (pygame.K_w,), (pygame.K_s,), (pygame.K_a,), (pygame.K_d,),
+                  (pygame.K_w, pygame.K_a), (pygame.K_w, pygame.K_d), (pygame.K_s, pygame.K_a), (pygame.K_s, pygame.K_d)]
+    held = {"keys": (), "frames": 0}
+
+    def policy(frame, state):
+        if held["frames"] <= 0:
+            held["keys"] = rng.choice(directions)
+            held["frames"] = rng.randrange(10, 60)
+        held["frames"] -= 1
+
+        return {key: True for key in held["keys"]}, rng.random() < 0.05
+
+    return policy
+
+# Plays back a script of [frames, keys, fire] steps over and over, e.g. [[30, "wa", false], [1, "", true]].
+# The keys are the letters of the pygame key constants, "wa" holds K_w and K_a.
+def scripted_policy(script):
+    steps = [(frames, {getattr(pygame, f"K_{key}"): True for key in keys}, fire) for frames, keys, fire in script]
+    length = sum(step[0] for step in steps)
+
+    def policy(frame, state):
+        frame %= length
+        for frames, keys, fire in steps:
+            if frame < frames:
+                # Fire only on the first frame of a step
+                return keys, fire and frame == 0
+            frame -= frames
+
+    return policy
+
+################################
+
+# Starts a new game in main.state without opening a window. No pygame module needs to be initialized for that.
+def start(seed=0, dt=main.SIMULATION_DT, substeps=1, mode="classic"):
+    main.state = main.create_state(seed, headless=True, substeps=substeps, spawn_mode=mode)
+    main.state["dt"] = dt
+    main.state["page"] = "game"
+    main.reset_game_state()
+
+    return main.state
+
+# Plays one frame with the given input
+def advance(keys, fire):
+    state = main.state
+
+    state["keys"] = collections.defaultdict(bool, keys)
+    if fire:
+        main.fire_bullet()
+
+    main.step()
+
+# Plays a whole game and returns a summary of it.
+# Stops after the given number of frames or when the player dies, unless stop_on_game_over is False.
+# setup is called with the new state before the first frame, e.g. for changing the spawn settings.
+def run(frames, seed=0, dt=main.SIMULATION_DT, substeps=1, policy=idle_policy, stop_on_game_over=True, setup=None,
+        mode="classic"):
+    state = start(seed, dt, substeps, mode)
+
+    if setup is not None:
+        setup(state)
+
+    start_time = time.perf_counter()
+    frame = 0
+
+    while frame < frames:
+        profiler.begin_frame()
+        keys, fire = policy(frame, state)
+        advance(keys, fire)
+        profiler.end_frame(objects=len(state["objects"]), bullets=len(state["bullets"]))
+        frame += 1
+
+        if stop_on_game_over and state["page"] != "game":
+            break
+
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        "seed": seed,
+        "frames": frame,
+        "game_over": state["page"] == "game_over",
+        "survival_time": frame * dt,
+        "score": state["score"],
+        "objects": len(state["objects"]),
+        "bullets": len(state["bullets"]),
+        "wall_time": elapsed,
+        "fps": frame / elapsed if elapsed > 0 else float("inf")
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the game without a window")
+    parser.add_argument("--frames", type=int, default=3600)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--substeps", type=int, default=1)
+    parser.add_argument("--dt", type=float, default=main.SIMULATION_DT)
+    parser.add_argument("--mode", choices=waves.MODES, default="classic", help="How the asteroids are spawned")
+    parser.add_argument("--random-input", action="store_true", help="Move and shoot randomly instead of idling")
+    parser.add_argument("--profile", metavar="FILE", help="Record per-frame timings into a .csv or .json file")
+    parser.add_argument("--snapshot", metavar="FILE", help="Start from a saved world instead of a new game")
+    parser.add_argument("--save-snapshot", metavar="FILE", help="Save the world at the end of the run")
+    args = parser.parse_args()
+
+    if args.profile:
+        profiler.enable(history=args.frames)
+
+    policy = random_policy(args.seed) if args.random_input else idle_policy
+    # Starts straight from the arrays in the file, unless the run saves over it at the end
+    copy = args.snapshot is not None and args.save_snapshot is not None and \
+        os.path.abspath(args.save_snapshot) == os.path.abspath(args.snapshot)
+    setup = (lambda state: main.load_snapshot(args.snapshot, copy)) if args.snapshot else None
+    result = run(args.frames, args.seed, args.dt, args.substeps, policy, setup=setup, mode=args.mode)
+
+    for key, value in result.items():
+        print(f"{key}: {value}")
+
+    if args.profile:
+        profiler.dump(args.profile)
+
+    if args.save_snapshot:
+        snapshot.save(args.save_snapshot, main.state)
@@ -3,16 +3,35 @@
 
 # Pygame docs: https://www.pygame.org/docs/
 import pygame
+import argparse
+import collections
+import os
 import random
+import time
 
+import assets
+import bullets
+import colliders
+import events
 import physics
+import pipeline
+import profiler
+import rendering
+import replay
+import snapshot
+import sprites
+import waves
+import world
 
 ################################
 
 WINDOW_WIDTH = 1280
 WINDOW_HEIGHT = 960
 WINDOW_TITLE = "Another spaceship game"
-FPS_LIMIT = 60
+FPS_LIMIT = 144  # The most frames drawn per second. The game is simulated at SIMULATION_RATE whatever the frame rate.
+SIMULATION_RATE = 60  # Physics and game rule steps per second
+SIMULATION_DT = 1 / SIMULATION_RATE
+MAX_STEPS_PER_FRAME = 5  # After a stall the game slows down rather than taking ever more steps to catch up
 MAX_SPEED = 500  # The maximum speed for circles
 
 colors = [
@@ -23,17 +42,26 @@ colors = [
     (230, 230, 230)
 ]
 
-# Fonts
-pygame.font.init()
-FONT = pygame.font.Font(None, 74)
-SMALL_FONT = pygame.font.Font(None, 50)
-SCORE_FONT = pygame.font.Font(None, 36)
+# Every image the game uses, as the arguments of assets.image(): (name, size, scale, alpha)
+PLAYER_IMAGE = ("spaceship_red.png", None, 0.2, True)
+BULLET_IMAGE = ("bullet.png", (60, 70), None, True)  # Adjust the size as needed
+BACKGROUND_IMAGE = ("space.png", None, None, False)
+GUN_SOUND = "Gun+Silencer.mp3"
+
+QUICKSAVE_FILE = "quicksave.bin"  # Saved with F8 and loaded with F9 during a game
+
+# Font sizes, the fonts themselves are created on first use by assets.font()
+FONT = 74
+SMALL_FONT = 50
+SCORE_FONT = 36
 
 ################################
 
-def draw_text(screen, text, font, color, position):
-    text_surface = font.render(text, True, color)
-    screen.blit(text_surface, position)
+# The rendered text is cached, pass cache=False for text that changes every frame
+def draw_text(screen, text, size, color, position, cache=True):
+    font = assets.font(size)
+    text_surface = sprites.text(text, font, color) if cache else font.render(text, True, color)
+    return rendering.mark(state["renderer"], screen.blit(text_surface, position))
 
 # Run for every event.
 # Place here the code that checks for user input.
@@ -46,6 +74,14 @@ def handleEvent(event):
 
     # A key has been pressed
     elif event.type == pygame.KEYDOWN:
+        # Profiling works on every page
+        if event.key == pygame.K_F3:
+            profiler.toggle_overlay()
+        elif event.key == pygame.K_F4:
+            profiler.dump(f"profile_{time.strftime('%Y%m%d_%H%M%S')}.csv")
+        elif event.key == pygame.K_F5:
+            rendering.toggle(state["renderer"])
+
         if state["page"] == "intro":
             if event.key == pygame.K_q:
                 state["running"] = False
@@ -60,9 +96,13 @@ def handleEvent(event):
         elif state["page"] == "game":
             if event.key == pygame.K_SPACE:
                 fire_bullet()
-                state["gun_sound"].play()
+                play_sound(GUN_SOUND)
             if event.key == pygame.K_ESCAPE:
                 state["running"] = False
+            if event.key == pygame.K_F8:
+                snapshot.save(QUICKSAVE_FILE, state)
+            if event.key == pygame.K_F9 and os.path.isfile(QUICKSAVE_FILE):
+                load_snapshot(QUICKSAVE_FILE)
         elif state["page"] == "game_over":
             if event.key == pygame.K_RETURN:
                 state["page"] = "intro"
@@ -86,35 +126,69 @@ def handleEvent(event):
 
 def reset_game_state():
     global state
-    state["objects"] = {}
-    state["bullets"] = []
+    state["objects"] = world.World()
+    state["bullets"].clear()
+    state["bullet_image"] = assets.image(*BULLET_IMAGE)
     initialize_player()
     state["spawn_timer"] = 0
-    state["spawn_interval"] = 3000
+    state["spawn_interval"] = waves.MODES[state["spawn_mode"]]["spawn_interval"]
+    state["wave"] = 0
+    state["spawn_queue"].clear()
+    sprites.circles.resize((state["max_radius"] - state["min_radius"]) * len(colors))
     state["score"] = 0
+    state["accumulator"] = 0
+    state["previous_positions"] = None
+
+    if state["replay_dir"] is not None:
+        start_recording()
+
+# Starts recording the game into a new file in state["replay_dir"]. The game gets a seed of its own, so it can be
+# played back from the start.
+def start_recording():
+    stop_recording()
+
+    seed = random.randrange(1 << 32)
+    state["rng"] = random.Random(seed)
+    path = os.path.join(state["replay_dir"], f"replay_{time.strftime('%Y%m%d_%H%M%S')}_{seed}.bin")
+    state["recorder"] = replay.Recorder(path, seed, state["substeps"], state["spawn_mode"])
+
+def stop_recording():
+    if state["recorder"] is not None:
+        state["recorder"].close()
+        state["recorder"] = None
+
+# Continues the game from a snapshot.save() file. Without copy the world keeps using the arrays in the file, which is
+# only safe as long as nothing saves over the file, like the F8 quick save does.
+# A replay can only hold a game played from its seed, so a game being recorded is recorded up to the load and no
+# further.
+def load_snapshot(path, copy=True):
+    stop_recording()
+    snapshot.load(path, state, copy)
+    state["previous_positions"] = None
+
+    # Images aren't saved in the snapshot
+    player = state["objects"][state["player_uid"]]
+    player["image"] = assets.image(*PLAYER_IMAGE)
+    player["image_rect"] = player["image"].get_rect(center=tuple(player["position"]))
 
 def initialize_player():
-    uid = generate_uid(state["objects"])
-    player_image = pygame.image.load("assets/spaceship_red.png")
-
-    # Rescale the image
-    scale_factor = 0.2
-    new_size = (int(player_image.get_width() * scale_factor), int(player_image.get_height() * scale_factor))
-    player_image = pygame.transform.scale(player_image, new_size)
+    player_image = assets.image(*PLAYER_IMAGE)
+    new_size = player_image.get_size()
 
     player = {
         "position": pygame.Vector2(WINDOW_WIDTH / 2, WINDOW_HEIGHT / 2),
         "velocity": pygame.Vector2(0, 0),
-        "radius": max(new_size) / 2,  # Approximate radius for collision
-          "mass": max(new_size)**3 / 8,
-         "image": player_image,
+        "radius": max(new_size) / 2,  # Approximate radius, used to keep the player inside the window
+        "mass": max(new_size)**3 / 8,
+        "colliders": [colliders.aabb(*new_size)],
+        "sensor": True,  # Asteroids pass through the player, touching one ends the game in check_player_collision()
+        "image": player_image,
         "image_rect": player_image.get_rect(center=(WINDOW_WIDTH / 2, WINDOW_HEIGHT / 2))
     }
-    state["objects"][uid] = player
-    state["player_uid"] = uid
+    state["player_uid"] = state["objects"].add(player)
 
 def update_player():
-    keys = pygame.key.get_pressed()
+    keys = state["keys"]
     player = state["objects"][state["player_uid"]]
 
     speed = 300  # Adjust Player speed as necessary
@@ -146,66 +220,93 @@ def update_player():
     player["image_rect"].center = player["position"]
 
 def update_bullets():
-    for bullet in state["bullets"][:]:
+    pool = state["bullets"]
+    i = 0
+    while i < len(pool):
+        bullet = pool[i]
         bullet["position"] += bullet["velocity"] * state["dt"]
         bullet["rect"].center = bullet["position"]
         if bullet["position"].y < 0:
-            state["bullets"].remove(bullet)
-        elif bullet.get("marked_for_removal") and bullet["drawn"]:
-            state["bullets"].remove(bullet)
+            pool.remove(i)  # The last bullet takes its place, so i stays the same
+        elif bullet["marked_for_removal"] and bullet["drawn"]:
+            pool.remove(i)
         else:
             bullet["drawn"] = True
+            i += 1
 
 def handle_bullet_collisions():
+    if len(state["bullets"]) == 0:
+        return
+
     player_uid = state.get("player_uid")
-    for bullet in state["bullets"][:]:
+    dt = state["dt"]
+
+    for bullet in state["bullets"]:
+        if bullet["marked_for_removal"]:
+            continue  # Already hit something
+
         bullet_rect = bullet["rect"]
-        for uid, obj in list(state["objects"].items()):
-            if uid == player_uid:
-                continue  # Skip the player object
-            if "radius" in obj:
-                circle_rect = pygame.Rect(obj["position"].x - obj["radius"], obj["position"].y - obj["radius"],
-                                          obj["radius"] * 2, obj["radius"] * 2)
-                if bullet_rect.colliderect(circle_rect):
-                    bullet["marked_for_removal"] = True
-                    del state["objects"][uid]
-                    state["score"] += 1  # Increment score
-                    break
+        bullet_colliders = [colliders.aabb(bullet_rect.w, bullet_rect.h)]
+        bullet_center = pygame.Vector2(bullet_rect.center)
+        move = bullet["velocity"] * dt
+        # Everything the bullet passed through this frame
+        query = (bullet_rect.left - max(move.x, 0), bullet_rect.top - max(move.y, 0),
+                 bullet_rect.right - min(move.x, 0), bullet_rect.bottom - min(move.y, 0))
+
+        for uid in physics.queryIndex(state["index"], query):
+            if uid == player_uid or uid not in state["objects"]:
+                continue  # Skip the player and the asteroids destroyed by an earlier bullet this frame
+
+            obj = state["objects"][uid]
+            if colliders.objectsOverlap(bullet_colliders, bullet_center, obj["colliders"], obj["position"]) or \
+                    bullet_passed_through(bullet, obj, dt):
+                bullet["marked_for_removal"] = True
+                del state["objects"][uid]
+                state["score"] += 1  # Increment score
+                break
+
+# At low frame rates a bullet can jump over an asteroid between two frames. Checks the path the bullet took relative to
+# the asteroid, but only when it moved farther than its own size, otherwise the rectangle test can't miss.
+def bullet_passed_through(bullet, obj, dt):
+    if "radius" not in obj:
+        return False
+
+    relative_velocity = bullet["velocity"] - (obj["velocity"] if "velocity" in obj else pygame.Vector2(0, 0))
+    size = min(bullet["rect"].size)
+    if relative_velocity.length() * dt <= size:
+        return False
+
+    end = bullet["position"] - obj["position"]
+    start = end - relative_velocity * dt
+    return physics.sweepSegmentCircle(start, end, pygame.Vector2(0, 0), obj["radius"] + size / 2) is not None
 
 def check_player_collision():
-    player = state["objects"][state["player_uid"]]
-    player_rect = player["image_rect"]
+    player_uid = state["player_uid"]
+    player = state["objects"][player_uid]
 
-    for uid, obj in list(state["objects"].items()):
-        if uid == state["player_uid"]:
+    for uid in physics.queryIndex(state["index"], physics.getObjectBounds(player)):
+        if uid == player_uid or uid not in state["objects"]:
             continue  # Skip the player object
-        if "radius" in obj:
-            circle_center = obj["position"]
-            circle_radius = obj["radius"]
 
-            # Check for collision between player rectangle and circle
-            closest_point = pygame.Vector2(
-                max(player_rect.left, min(circle_center.x, player_rect.right)),
-                max(player_rect.top, min(circle_center.y, player_rect.bottom))
-            )
+        obj = state["objects"][uid]
+        if colliders.objectsOverlap(player["colliders"], player["position"], obj["colliders"], obj["position"]):
+            state["page"] = "game_over"
+            return
 
-            distance = (closest_point - circle_center).length()
-            if distance < circle_radius:
-                state["page"] = "game_over"
-                return
+# Sounds are loaded, and the audio device opened, the first time they are played
+def play_sound(name):
+    if state["sound"]:
+        sound = assets.sound(name)
+        if sound is not None:
+            sound.play()
 
 def fire_bullet():
     player = state["objects"][state["player_uid"]]
-    bullet_image = state["bullet_image"]
-    bullet_rect = bullet_image.get_rect(center=(player["position"].x, player["position"].y - player["radius"]))
-    bullet = {
-        "position": pygame.Vector2(player["position"].x, player["position"].y - player["radius"]),
-        "velocity": pygame.Vector2(0, -500),
-        "image": bullet_image,
-        "rect": bullet_rect,
-        "drawn": False
-    }
-    state["bullets"].append(bullet)
+    position = (player["position"].x, player["position"].y - player["radius"])
+    state["bullets"].spawn(state["bullet_image"], position, (0, -500))
+
+    if state["recorder"] is not None:
+        state["recorder"].fire()
 
 # Run every frame.
 # Place here the code that changes the state of the game in some way every frame.
@@ -213,72 +314,98 @@ def update():
     # Get access to the global variables
     global state
 
-    if state["dragObject"] > -1:
-        for uid, obj in state["objects"].items():
-            if state["dragObject"] == uid:
-                obj["position"] = pygame.mouse.get_pos() - state["dragDelta"]
-                break
+    # The dragged object might have been destroyed in the meantime
+    if state["dragObject"] in state["objects"]:
+        state["objects"][state["dragObject"]]["position"] = pygame.mouse.get_pos() - state["dragDelta"]
 
     update_player()
     update_bullets()
+
+    # Cap the speed of circles for all objects at once. The physics step bounces them off the window edges.
+    state["objects"].capSpeed(MAX_SPEED)
+
+    # The one spatial index of the frame, used by the checks below and by the physics step.
+    # Asteroids that haven't entered the window yet are left out, nothing in the window can touch them.
+    state["index"] = physics.buildIndex(state["objects"], state["dt"] / state["substeps"], state["bounds"])
+
     handle_bullet_collisions()
     check_player_collision()
-    #physics.update(state["dt"], state["objects"], state["bounds"])
-
-    # Cap the speed of circles
-    for uid, obj in state["objects"].items():
-        if "velocity" in obj:
-            speed = obj["velocity"].length()
-            if speed > MAX_SPEED:
-                obj["velocity"].scale_to_length(MAX_SPEED)
-
-    for uid, obj in list(state["objects"].items()):
-        if "radius" in obj:
-            if obj["position"].x - obj["radius"] < 0:
-                obj["position"].x = obj["radius"]
-                obj["velocity"].x *= -1  # Reflect velocity
-            if obj["position"].x + obj["radius"] > WINDOW_WIDTH:
-                obj["position"].x = WINDOW_WIDTH - obj["radius"]
-                obj["velocity"].x *= -1  # Reflect velocity
-            if obj["position"].y - obj["radius"] < 0:
-                obj["position"].y = obj["radius"]
-                obj["velocity"].y *= -1  # Reflect velocity
-            if obj["position"].y + obj["radius"] > WINDOW_HEIGHT:
-                obj["position"].y = WINDOW_HEIGHT - obj["radius"]
-                obj["velocity"].y *= -1  # Reflect velocity
+
+# Everything draw() needs from the state. The objects and bullets are copied, so that the next steps can be simulated
+# while the frame is being drawn.
+def capture():
+    frame = {"page": state["page"], "score": state["score"]}
+
+    if state["page"] != "game":
+        return frame
+
+    # Everything is drawn between where it was on the last two steps
+    objects = state["objects"]
+    if state["previous_positions"] is None:
+        frame["positions"] = objects.position[:objects.count].copy()
+    else:
+        frame["positions"] = objects.interpolate(state["previous_positions"], state["previous_uids"], state["alpha"])
+
+    frame["radius"] = objects.radius[:objects.count].copy()
+    frame["slots"] = objects.mask().nonzero()[0].tolist()
+    frame["extras"] = objects.extras[:objects.count]  # The dictionaries aren't changed, only replaced
+
+    # Bullets fly in a straight line, so where they were is known without saving it
+    back = (1 - state["alpha"]) * state["dt"]
+    frame["bullets"] = [(bullet["image"], bullet["rect"].move(round(-bullet["velocity"].x * back),
+                                                              round(-bullet["velocity"].y * back)))
+                        for bullet in state["bullets"]]
+
+    return frame
 
 # Run every frame.
 # Place here the code that draws on the screen every frame.
-def draw():
+# Draws the given capture() of the state, by default the current state.
+def draw(frame=None):
     # Get access to the global variables
     global state
 
-    # Background
-    state["screen"].blit(state["background"], (0, 0))
+    if frame is None:
+        frame = capture()
 
-    if state["page"] == "intro":
+    renderer = state["renderer"]
+
+    # Background, or with dirty rectangle rendering only the parts that were drawn over last frame
+    if not rendering.begin(renderer, state["screen"], state["background"], frame["page"]):
+        return  # Nothing has changed
+
+    if frame["page"] == "intro":
         draw_text(state["screen"], "Play", FONT, (255, 255, 255), (WINDOW_WIDTH // 2 - 50, WINDOW_HEIGHT // 2 - 100))
         draw_text(state["screen"], "How to Play", FONT, (255, 255, 255), (WINDOW_WIDTH // 2 - 150, WINDOW_HEIGHT // 2))
         draw_text(state["screen"], "Quit", FONT, (255, 255, 255), (WINDOW_WIDTH // 2 - 50, WINDOW_HEIGHT // 2 + 100))
 
-    elif state["page"] == "how_to_play":
+    elif frame["page"] == "how_to_play":
         draw_text(state["screen"], "How to Play", FONT, (255, 255, 255), (WINDOW_WIDTH // 2 - 150, 100))
         draw_text(state["screen"], "Use W/A/S/D to move", SMALL_FONT, (255, 255, 255), (100, 300))
         draw_text(state["screen"], "Press Space to shoot", SMALL_FONT, (255, 255, 255), (100, 400))
         draw_text(state["screen"], "Press ESC to quit the game", SMALL_FONT, (255, 255, 255), (100, 500))
         draw_text(state["screen"], "Press B to go back", SMALL_FONT, (255, 255, 255), (100, 600))
 
-    elif state["page"] == "game":
-        for uid, obj in state["objects"].items():
-            if "color" in obj and "radius" in obj:
-                pygame.draw.circle(state["screen"], obj["color"], obj["position"], obj["radius"])
-            elif "image" in obj:
-                state["screen"].blit(obj["image"], obj["image_rect"])
-        for bullet in state["bullets"]:
-            state["screen"].blit(bullet["image"], bullet["rect"])
-
-        draw_text(state["screen"], f"Score: {state['score']}", SCORE_FONT, (255, 255, 255), (10, 10))
-    elif state["page"] == "game_over":
+    elif frame["page"] == "game":
+        positions = frame["positions"]
+        for slot in frame["slots"]:
+            extra = frame["extras"][slot]
+            if "color" in extra:
+                rendering.mark(renderer, sprites.draw_circle(state["screen"], extra["color"], positions[slot],
+                                                             frame["radius"][slot]))
+            elif "image" in extra:
+                rect = extra["image"].get_rect(center=positions[slot])
+                rendering.mark(renderer, state["screen"].blit(extra["image"], rect))
+
+        for image, rect in frame["bullets"]:
+            rendering.mark(renderer, state["screen"].blit(image, rect))
+
+        draw_text(state["screen"], f"Score: {frame['score']}", SCORE_FONT, (255, 255, 255), (10, 10))
+
+        if profiler.overlay:
+            for i, line in enumerate(profiler.overlay_lines()):
+                draw_text(state["screen"], line, SCORE_FONT, (255, 255, 0), (10, 40 + 26 * i), cache=False)
+    elif frame["page"] == "game_over":
         draw_text(state["screen"], "Oh no, you lost!", FONT, (255, 255, 255),
                   (WINDOW_WIDTH // 2 - 200, WINDOW_HEIGHT // 2 - 50))
         draw_text(state["screen"], "Press Enter to return to main menu", SMALL_FONT, (255, 255, 255),
@@ -287,63 +414,137 @@ def draw():
 
 ################################
 
-# Generates a new unique ID number. Necessary for procedurally creating new objects and referencing them later on.
-# TODO: In the future objects will be destroyed, but UIDs would still increase indefinetly. Make it smarter.
-def generate_uid(objects):
-    largest_uid = -1
-
-    for uid in objects.keys():
-        if uid > largest_uid:
-            largest_uid = uid
-
-    return largest_uid + 1
-
-################################
-
 def spawn_circle():
-    uid = generate_uid(state["objects"])
-    x = random.randrange(50, WINDOW_WIDTH - 50, 1)
+    rng = state["rng"]
+    x = rng.randrange(50, WINDOW_WIDTH - 50, 1)
     y = -50  # Start from above the top of the screen
-    r = random.randrange(10, 100, 1)
-    velocity = pygame.Vector2(random.uniform(-100, 100), random.uniform(50, 200))  # Random direction and speed
+    r = rng.randrange(state["min_radius"], state["max_radius"], 1)
+    velocity = pygame.Vector2(rng.uniform(-100, 100), rng.uniform(50, 200))  # Random direction and speed
 
-    state["objects"][uid] = {
+    state["objects"].add({
         "position": pygame.Vector2(x, y),
         "velocity": velocity,
         "mass": r**3,  # With constant density mass is proportional to radius cubed
         "radius": r,
-        "color": random.choice(colors),
+        "colliders": [colliders.circle(r)],
+        "color": rng.choice(colors),
         "tag": "asteroid"
-    }
+    })
 
-# Program entry point
-if __name__ == "__main__":
-    pygame.init()
-    pygame.display.set_caption(WINDOW_TITLE)
+# Counts down the spawn timer and spawns a new wave of asteroids when it runs out, see waves.py.
+# The asteroids of big waves are added over several frames.
+def update_spawner():
+    state["spawn_timer"] += state["dt"] * 1000  # The timer is in milliseconds
+
+    asteroids = len(state["objects"]) - (state["player_uid"] in state["objects"]) + len(state["spawn_queue"])
+    if state["spawn_timer"] >= state["spawn_interval"] and asteroids < state["max_circles"]:
+        size = min(waves.get_wave_size(state, state["wave"]), state["max_circles"] - asteroids)
 
+        # Single asteroids are spawned like they always were, so seeded classic games play out the same
+        if size == 1:
+            spawn_circle()
+        else:
+            state["spawn_queue"].push(waves.generate(state["rng"].getrandbits(64), size, WINDOW_WIDTH,
+                                                     state["min_radius"], state["max_radius"], len(colors)))
+
+        state["wave"] += 1
+        state["spawn_timer"] = 0
+        # Decrease the interval, but not below the minimum
+        state["spawn_interval"] = max(state["min_spawn_interval"], state["spawn_interval"] - state["spawn_interval_decay"])
+
+    state["spawn_queue"].place(state["objects"], colors)
+
+# Advances the game by one frame of state["dt"] seconds: game rules, physics and spawning.
+# Shared by the program loop and the headless runner.
+def step():
+    update()
+    profiler.lap("update")
+
+    substeps = state["substeps"]
+    for i in range(substeps):
+        # Later substeps start from moved objects and need an index of their own
+        index = state["index"] if i == 0 else None
+        collisions = physics.update(state["dt"] / substeps, state["objects"], state["bounds"], state["collisionEventType"],
+                                    index=index, events=state["collisionEvents"])
+        profiler.lap("physics", i)
+        profiler.count("collisions", len(collisions))
+
+    # Every contact of the frame once, to whoever subscribed to the tags of the objects
+    state["collisionEvents"].drain(state["objects"])
+    profiler.lap("contacts")
+
+    update_spawner()
+    profiler.lap("spawn")
+
+# Takes as many steps of SIMULATION_DT as the time since the last frame calls for. The time left over carries over to
+# the next frame and tells draw() how far between the last two steps to draw everything.
+def simulate(frame_time):
+    state["accumulator"] += frame_time
+    steps = 0
+
+    while state["accumulator"] >= SIMULATION_DT and state["page"] == "game":
+        if steps == MAX_STEPS_PER_FRAME:
+            state["accumulator"] %= SIMULATION_DT  # Give up on the time that couldn't be caught up with
+            break
+
+        objects = state["objects"]
+        state["previous_positions"] = objects.position[:objects.count].copy()
+        state["previous_uids"] = objects.uids[:objects.count].copy()
+
+        if state["recorder"] is not None:
+            state["recorder"].frame(state["dt"], state["keys"])
+        step()
+
+        state["accumulator"] -= SIMULATION_DT
+        steps += 1
+
+    state["alpha"] = min(state["accumulator"] / SIMULATION_DT, 1)
+
+# Creates the global program state.
+# A headless state has no window, no sound and no background.
+# Collisions are handed out through state["collisionEvents"]. With post_collision_events they are also posted to the
+# pygame event queue like they used to be, except when headless.
+def create_state(seed=None, headless=False, substeps=1, dirty_rects=False, post_collision_events=False,
+                 spawn_mode="classic"):
     # The state dictionary holds all the global variables some core functions such as update() and handleEvent() need.
     # The keys are variable name strings and the values are the corresponding variable values.
     # Every function that needs access to this global program state must have a line containing 'global state'.
-    state = {
-        "screen": pygame.display.set_mode([WINDOW_WIDTH, WINDOW_HEIGHT]),
+    return {
+        "screen": None if headless else pygame.display.set_mode([WINDOW_WIDTH, WINDOW_HEIGHT]),
         "clock": pygame.time.Clock(),
-        "dt": 1 / FPS_LIMIT, # Deltatime aka time between the current frame and the last frame.
+        "dt": SIMULATION_DT, # Deltatime aka the time one step of the game takes, fixed when playing for real
+        "frame_time": 0, # The time between the current frame and the last frame, in seconds
+        "accumulator": 0, # Time that hasn't been simulated yet, less than SIMULATION_DT after every frame
+        "alpha": 1, # How far between the last two steps draw() shows things, from 0 to 1
+        "previous_positions": None, # The object positions by slot before the last step, for interpolating
+        "previous_uids": None, # The object UIDs by slot before the last step
         "running": True,
-        "collisionEventType": pygame.event.custom_type(),
+        "collisionEventType": pygame.event.custom_type() if post_collision_events and not headless else None,
+        "collisionEvents": events.CollisionBuffer(), # Subscribe to collisions by tag, drained once per frame in step()
+        "substeps": substeps, # How many physics steps are taken per frame. Fast collisions are found by physics either way.
+        "renderer": rendering.create(dirty_rects), # Dirty rectangle rendering, toggled with F5
+        "rng": random.Random(seed), # All the game's randomness comes from here, so a seed reproduces a game
+        "keys": collections.defaultdict(bool), # Keyboard state, pygame.key.get_pressed() when playing for real
+        "replay_dir": None, # Where every game is recorded to, see replay.py. None to not record.
+        "recorder": None, # The replay.Recorder of the current game
 
         "dragObject": -1, # The UID of the object being dragged. Is set to -1 when not dragging because UIDs are only positive.
         "dragDelta": pygame.Vector2(0, 0), # The difference between the object's position and the mouse's position
 
         "bounds": pygame.Rect(0, 0, WINDOW_WIDTH, WINDOW_HEIGHT),
-        "background": pygame.image.load("assets/space.png"),
-        "objects": {},
-        "gun_sound": pygame.mixer.Sound("assets/Gun+Silencer.mp3"),  # Load the gun sound
-        "bullet_image": pygame.transform.scale(pygame.image.load("assets/bullet.png"), (60, 70)),  # Adjust the size as needed
-        "bullets": [],
-
+        "index": None, # The spatial index of the current frame, see physics.buildIndex()
+        "background": None, # Set by update_streamed_assets() once the background has been loaded
+        "asset_loader": None, # The thread loading the images in the background, see start_up()
+        "objects": world.World(),
+        "sound": not headless, # Whether sounds are played
+        "bullet_image": None, # Loaded when a game starts
+        "bullets": bullets.BulletPool(),
+
+        "spawn_mode": spawn_mode,  # One of waves.MODES, which also fills in the spawn settings below
+        **waves.MODES[spawn_mode],
         "spawn_timer": 0,
-        "spawn_interval": 3000,  # Initial interval in milliseconds
-        "max_circles": 8,  # Maximum number of circles on the screen
+        "wave": 0,  # How many waves have been spawned
+        "spawn_queue": waves.SpawnQueue(),  # Asteroids of the last waves waiting to be added
 
         "page": "intro",
         "play_button": pygame.Rect(WINDOW_WIDTH // 2 - 100, WINDOW_HEIGHT // 2 - 100, 200, 50),
@@ -353,35 +554,86 @@ if __name__ == "__main__":
         "score": 0  # Initialize score
     }
 
-    initialize_player()
+# Opens the window and returns the state, ready for drawing the intro page. Only the display is initialized here: the
+# images are loaded on a background thread while the intro is already showing, fonts and sounds on first use.
+def start_up(spawn_mode="classic", replay_dir=None):
+    global state
+
+    pygame.display.init()
+    pygame.display.set_caption(WINDOW_TITLE)
+
+    # Start loading the images while the window is being set up
+    loader = assets.preload([image for image in (PLAYER_IMAGE, BULLET_IMAGE, BACKGROUND_IMAGE)
+                             if assets.exists(image[0])], background=True)
+
+    state = create_state(spawn_mode=spawn_mode)
+    state["replay_dir"] = replay_dir
+    state["asset_loader"] = loader
+
+    return state
+
+# Picks up the images the loader thread has finished since the last frame. The rest are loaded on first use anyway.
+def update_streamed_assets():
+    if state["background"] is None and state["screen"] is not None and assets.loaded(BACKGROUND_IMAGE):
+        state["background"] = assets.image(*BACKGROUND_IMAGE)
+        rendering.invalidate(state["renderer"])  # Redraw everything on top of it
+
+# Program entry point
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=WINDOW_TITLE)
+    parser.add_argument("--record", metavar="DIRECTORY", help="Record every game into a replay file in the directory")
+    parser.add_argument("--mode", choices=waves.MODES, default="classic", help="How the asteroids are spawned")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="Simulate the next frame on another thread while drawing the current one, "
+                             "see pipeline.py for when that helps")
+    args = parser.parse_args()
+
+    state = start_up(args.mode, args.record)
+
+    simulation = pipeline.Pipeline() if args.pipelined and pipeline.worthwhile() else None
+    if args.pipelined and simulation is None:
+        print("Only one core available, running the simulation on the main thread")
+    frame = None
 
     # Program loop
     while state["running"]:
+        profiler.begin_frame()
+        update_streamed_assets()
+
+        if simulation is not None:
+            # The steps started last frame must be done before the state can be touched. What they made is drawn below.
+            simulation.wait()
+            profiler.lap("wait")
+            frame = capture()
+
         # Handle all available events
         for event in pygame.event.get():
             handleEvent(event)
+        profiler.lap("events")
 
         # Game code goes there
         if state["page"] == "game":
-            update()
+            state["keys"] = pygame.key.get_pressed()
 
-            substeps = 2
-            for i in range(substeps):
-                physics.update(state["dt"] / substeps, state["objects"], state["bounds"], state["collisionEventType"])
+            if simulation is not None:
+                frame_time = state["frame_time"]
+                simulation.submit(lambda: simulate(frame_time))
+            else:
+                simulate(state["frame_time"])
 
-        draw()
+        draw(frame)
+        profiler.lap("draw")
 
         # Update the window
-        pygame.display.flip()
+        rendering.present(state["renderer"])
+        profiler.lap("flip")
+        profiler.end_frame(objects=len(state["objects"]), bullets=len(state["bullets"]))
 
         # Limit the framerate
-        state["dt"] = state["clock"].tick(FPS_LIMIT) / 1000  # Correct dt calculation (tick() returns milliseconds)
+        state["frame_time"] = state["clock"].tick(FPS_LIMIT) / 1000  # tick() returns milliseconds
 
-        state["spawn_timer"] += state["clock"].get_time()
-        if state["spawn_timer"] >= state["spawn_interval"] and len(state["objects"]) < state["max_circles"]:
-            spawn_circle()
-            state["spawn_timer"] = 0
-            state["spawn_interval"] = max(500,
-                                          state["spawn_interval"] - 50)  # Decrease the interval, but not below 500ms
+    if simulation is not None:
+        simulation.stop()
 
-    pygame.quit()
\ No newline at end of file
+    stop_recording()
+    pygame.quit()
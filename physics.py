@@ -1,5 +1,25 @@
+import bisect
+import math
+
+import numpy
 import pygame
 
+import broadphase
+import colliders
+import world
+
+# The broadphase used for finding candidate collision pairs: "grid", "sweep" or "bruteforce".
+# "bruteforce" is the original all-pairs search, useful for checking that the others give the same results.
+BROADPHASE = "grid"
+
+# Whether update() looks for fast objects that would pass through each other within a step and resolves those
+# collisions at their time of impact. Slow pairs are left to the normal overlap tests.
+CONTINUOUS = True
+
+# How many passes applyCollisions() makes over the contacts of a world.World. Only objects in several contacts at once
+# need more than the first.
+SOLVER_ITERATIONS = 8
+
 
 def solveCollision(collision):
     # All collisions are perfectly elastic
@@ -39,28 +59,334 @@ def solveCollision(collision):
             other_u2 * otherAxis + v2 * collisionAxis]
 
 
+# solveCollision for many collisions at once. Takes (n, 2) arrays of velocities and displacements of the first object
+# and (n,) arrays of masses and returns the new velocities of both objects.
+# Only the velocity component along the collision axis changes, so v = u + (v_axis - u_axis) * axis.
+def solveCollisions(velocity1, velocity2, mass1, mass2, displacement):
+    collisionAxis = displacement / numpy.linalg.norm(displacement, axis=1)[:, None]
+
+    u1 = numpy.einsum("ij,ij->i", collisionAxis, velocity1)
+    u2 = numpy.einsum("ij,ij->i", collisionAxis, velocity2)
+
+    v1 = u1 + 2 * mass2 / (mass1 + mass2) * (u2 - u1)
+    v2 = u2 + 2 * mass1 / (mass1 + mass2) * (u1 - u2)
+
+    return velocity1 + (v1 - u1)[:, None] * collisionAxis, velocity2 + (v2 - u2)[:, None] * collisionAxis
+
+
+# Collision response for a world.World, all collisions of a substep in one go.
+# With an object in several contacts the impulses of the contacts depend on each other, so they are found in two
+# phases. First the contacts are made to stop approaching, in SOLVER_ITERATIONS Jacobi passes: every pass works out the
+# impulse each contact still needs from the velocities the previous pass left and applies it scaled down by the larger
+# contact count of the two objects, so the contacts of an object share its response instead of each adding a full one.
+# Then every contact gets the impulse it took to stop once more, which makes them separate again. Doubling the
+# stopping impulses like that conserves the kinetic energy, and both objects of a contact get the same impulse, so
+# momentum is conserved too. A contact only ever pushes.
+# The contacts are split into contact islands by labelIslands(). An island is done as soon as a pass doesn't change
+# its impulses any more, and only the islands still settling make another pass.
+# A lone contact is solved in the first pass exactly like solveCollision() does.
+# The position corrections of all the contacts of an object are added together.
+def applyCollisions(world, collisions):
+    if not collisions:
+        return
+
+    slots1 = numpy.array([world.slots.get(collision[0]["uid"], -1) for collision in collisions])
+    slots2 = numpy.array([world.slots.get(collision[1]["uid"], -1) for collision in collisions])
+    displacement1 = numpy.array([tuple(collision[0]["displacement"]) for collision in collisions])
+    displacement2 = numpy.array([tuple(collision[1]["displacement"]) for collision in collisions])
+    mass1 = numpy.array([collision[0]["mass"] for collision in collisions], dtype=float)
+    mass2 = numpy.array([collision[1]["mass"] for collision in collisions], dtype=float)
+
+    valid1 = slots1 >= 0  # Walls (uid -1) don't move
+    valid2 = slots2 >= 0
+    length = numpy.linalg.norm(displacement1, axis=1)
+    collisionAxis = displacement1 / numpy.where(length > 0, length, 1)[:, None]
+
+    counts = numpy.bincount(numpy.concatenate((slots1[valid1], slots2[valid2])), minlength=world.count)
+    share = 1 / numpy.maximum(numpy.where(valid1, counts[slots1], 1), numpy.where(valid2, counts[slots2], 1))
+    reducedMass = mass1 * mass2 / (mass1 + mass2)
+
+    island = labelIslands(slots1, slots2, world.count)
+
+    velocity = world.velocity[:world.count]
+
+    # Relative velocity along the collision axes of the given contacts, negative when approaching
+    def approachSpeed(contacts):
+        velocity1 = numpy.where(valid1[contacts, None], velocity[slots1[contacts]], 0)
+        velocity2 = numpy.where(valid2[contacts, None], velocity[slots2[contacts]], 0)
+        return numpy.einsum("ij,ij->i", collisionAxis[contacts], velocity1 - velocity2)
+
+    def applyImpulses(contacts, impulses):
+        change = impulses[:, None] * collisionAxis[contacts]
+        for slots, valid, sign, mass in ((slots1, valid1, 1, mass1), (slots2, valid2, -1, mass2)):
+            valid = valid[contacts]
+            for axis in (0, 1):
+                velocity[:, axis] += numpy.bincount(slots[contacts][valid],
+                                                    sign * change[valid, axis] / mass[contacts][valid], world.count)
+
+    impulse = numpy.zeros(len(collisions))  # Applied so far, never negative
+    contacts = numpy.arange(len(collisions))  # The contacts of the islands still settling
+
+    for i in range(SOLVER_ITERATIONS):
+        oldImpulse = impulse[contacts]
+        newImpulse = numpy.where(length[contacts] > 0,
+                                 numpy.maximum(oldImpulse - (share * reducedMass)[contacts] * approachSpeed(contacts),
+                                               0), 0)
+        changed = newImpulse != oldImpulse
+
+        applyImpulses(contacts[changed], (newImpulse - oldImpulse)[changed])
+        impulse[contacts] = newImpulse
+
+        settling = numpy.zeros(world.count, dtype=bool)
+        settling[island[contacts[changed]]] = True
+        contacts = contacts[settling[island[contacts]]]
+        if len(contacts) == 0:
+            break
+
+    applyImpulses(numpy.arange(len(collisions)), impulse)
+
+    positionChange = numpy.zeros((world.count, 2))
+
+    for slots, valid, displacement in ((slots1, valid1, displacement1), (slots2, valid2, displacement2)):
+        # Move the objects away a bit more than just the displacement to avoid very small collisions
+        length = numpy.linalg.norm(displacement[valid], axis=1)
+        correction = displacement[valid] * ((length + 0.01) / numpy.where(length > 0, length, 1))[:, None]
+        numpy.add.at(positionChange, slots[valid], correction)
+
+    world.position[:world.count] += positionChange
+
+
+# What checkObjectProperties() asks of an object in a world.World, in its flags. It must not have IS_SENSOR either.
+SOLID = world.HAS_VELOCITY | world.HAS_MASS | world.HAS_EXTENT
+
+
+# Whether the object takes part in collisions. A sensor (obj["sensor"] set) has colliders for the game rules to query,
+# but physics lets everything pass through it.
 def checkObjectProperties(obj):
-    return "colliders" in obj and "velocity" in obj and "mass" in obj and len(obj["colliders"]) > 0
+    return "colliders" in obj and "velocity" in obj and "mass" in obj and len(obj["colliders"]) > 0 and \
+        not obj.get("sensor", False)
+
+
+# Time in [0, dt] when two moving circles first touch, or None if they don't within dt.
+# Circles that already overlap at the start return None too, the overlap test takes care of them.
+# findWorldTimesOfImpact() does the same for many circles at once, with the same operations.
+def sweepCircleCircle(pos1, vel1, r1, pos2, vel2, r2, dt):
+    # Solving |d + v * t| = r1 + r2 for t, where d and v are the relative position and velocity
+    d = pos1 - pos2
+    v = vel1 - vel2
+
+    a = v.dot(v)
+    b = 2 * d.dot(v)
+    c = d.dot(d) - (r1 + r2) * (r1 + r2)
+
+    if c <= 0 or a == 0:
+        return None
+
+    discriminant = b * b - 4 * a * c
+    if discriminant < 0:
+        return None
+
+    t = (-b - math.sqrt(discriminant)) / (2 * a)
+    if 0 <= t <= dt:
+        return t
 
+    return None
 
-def checkCollisionCircleCircle(pos1, r1, pos2, r2):
-    return (pos1 - pos2).length_squared() < (r1 + r2) ** 2
+# How far along the segment from start to end (0 to 1) a point moving along it first enters the circle,
+# or None if it doesn't. Used for bullets, which are fast and small.
+def sweepSegmentCircle(start, end, center, radius):
+    t = sweepCircleCircle(start, end - start, 0, center, pygame.Vector2(0, 0), radius, 1)
 
-def getDisplacementCircleCircle(pos1, r1, pos2, r2):
-    difference = pos1 - pos2
-    distance = difference.length()
-    return difference / distance * (r1 + r2 - distance) / 2
+    if t is None and (start - center).length_squared() <= radius ** 2:
+        return 0  # Starts inside
 
-def findObjectCollisions(objects):
+    return t
+
+def getObjectBounds(obj):
+    return colliders.getObjectBounds(obj["colliders"], obj["position"])
+
+################################
+# Shared spatial index
+
+# One spatial index over every object with colliders. A frame builds it once and the game rules (player and bullet
+# checks) and the physics step all query it, so no pair of objects gets tested by several broadphases.
+# The boxes cover the whole way the objects move during dt, which keeps the index valid both before and after the
+# move, except for the objects resolveTimesOfImpact() bounces onto a new path: updateIndex() grows their boxes.
+# Objects removed after the index was built are skipped by the users of the index.
+# With a region (a pygame.Rect, normally the play area) the objects that can't reach it during dt are inactive and left
+# out, see isInactive().
+# The index of a world.World keeps the uids, slots and boxes in NumPy arrays and finds its pairs with the array
+# broadphases, everything else is indexed in lists and a broadphase grid.
+def buildIndex(objects, dt=0, region=None):
+    if region is not None:
+        region = (region.left, region.top, region.right, region.bottom)
+
+    if hasattr(objects, "getBoxes"):
+        slots, boxes = objects.getBoxes(dt, region)  # A world.World, from the cached collider extents
+        return {"uids": objects.uids[slots], "slots": slots, "boxes": boxes, "pairs": {}}
+
+    uids = []
+    boxes = []
+
+    for uid, obj in objects.items():
+        if "colliders" not in obj or len(obj["colliders"]) == 0:
+            continue
+
+        minX, minY, maxX, maxY = getObjectBounds(obj)
+
+        if "velocity" in obj:
+            moveX = obj["velocity"].x * dt
+            moveY = obj["velocity"].y * dt
+            minX += min(moveX, 0)
+            minY += min(moveY, 0)
+            maxX += max(moveX, 0)
+            maxY += max(moveY, 0)
+
+        if region is not None and not broadphase.overlaps((minX, minY, maxX, maxY), region):
+            continue  # Inactive
+
+        uids.append(uid)
+        boxes.append((minX, minY, maxX, maxY))
+
+    return {"uids": uids, "boxes": boxes, "grid": broadphase.buildGrid(boxes), "pairs": {}}
+
+# Candidate pairs of uids from the index, in the order the objects were indexed. Found once per broadphase method.
+def getIndexPairs(index, method):
+    if "slots" in index:
+        first, second = getIndexPairArrays(index, method)
+        return list(zip(index["uids"][first].tolist(), index["uids"][second].tolist()))
+
+    if method not in index["pairs"]:
+        uids = index["uids"]
+        index["pairs"][method] = [(uids[i], uids[j]) for i, j in broadphase.findPairs(index["boxes"], method)]
+
+    return index["pairs"][method]
+
+# getIndexPairs() for the index of a world.World, as two arrays of positions in the index
+def getIndexPairArrays(index, method):
+    if method not in index["pairs"]:
+        index["pairs"][method] = broadphase.findPairsArray(index["boxes"], method)
+
+    return index["pairs"][method]
+
+# The current slots of the objects in the index of a world.World, -1 for the ones removed since it was built.
+# Only compacting the world moves objects to other slots.
+def getIndexSlots(world, index):
+    slots = index["slots"]
+    moved = numpy.flatnonzero(world.uids[slots] != index["uids"])
+
+    if len(moved):
+        slots = slots.copy()
+        slots[moved] = [world.slots.get(uid, -1) for uid in index["uids"][moved].tolist()]
+
+    return slots
+
+# Grows the boxes of the given objects to also cover where they are now, and adds the candidate pairs that gives to
+# the pairs already found, so that the index matches one built with the grown boxes
+def updateIndex(index, objects, moved):
+    if "slots" in index:
+        updateIndexArrays(index, objects, moved)
+        return
+
+    uids = index["uids"]
+    positions = dict(zip(uids, range(len(uids))))
+    grown = []
+
+    for uid in moved:
+        i = positions.get(uid)
+        if i is None or uid not in objects:
+            continue  # Inactive or removed
+
+        box = index["boxes"][i]
+        minX, minY, maxX, maxY = getObjectBounds(objects[uid])
+        broadphase.growGrid(index["grid"], i, (min(box[0], minX), min(box[1], minY),
+                                               max(box[2], maxX), max(box[3], maxY)))
+        grown.append(i)
+
+    found = set()
+    for i in grown:
+        for j in broadphase.queryGrid(index["grid"], index["boxes"][i]):
+            if j != i:
+                found.add((min(i, j), max(i, j)))
+
+    # Into the pairs of every broadphase method, keeping them in index order
+    for pairs in index["pairs"].values():
+        for i, j in sorted(found):
+            k = bisect.bisect_left(pairs, (i, j), key=lambda pair: (positions[pair[0]], positions[pair[1]]))
+            if k == len(pairs) or pairs[k] != (uids[i], uids[j]):
+                pairs.insert(k, (uids[i], uids[j]))
+
+def updateIndexArrays(index, world, moved):
+    boxes = index["boxes"]
+    grown = numpy.flatnonzero(numpy.isin(index["uids"], moved))
+    slots = getIndexSlots(world, index)[grown]
+    grown = grown[slots >= 0]  # Not removed
+    slots = slots[slots >= 0]
+
+    bounds = world.position[slots][:, [0, 1, 0, 1]] + world.extent[slots]
+    boxes[grown, :2] = numpy.minimum(boxes[grown, :2], bounds[:, :2])
+    boxes[grown, 2:] = numpy.maximum(boxes[grown, 2:], bounds[:, 2:])
+
+    n = len(boxes)
+    first, second = broadphase.queryManyArray(boxes, boxes[grown])
+    first = grown[first]
+    keep = first != second
+    found = numpy.minimum(first, second)[keep] * n + numpy.maximum(first, second)[keep]
+
+    for method, (first, second) in index["pairs"].items():
+        keys = numpy.union1d(first * n + second, found)
+        index["pairs"][method] = (keys // n, keys % n)
+
+# The uids of the indexed objects whose boxes overlap the given box, in the order the objects were indexed
+def queryIndex(index, box):
+    if "slots" in index:
+        return index["uids"][broadphase.queryArray(index["boxes"], box)].tolist()
+
+    return [index["uids"][i] for i in broadphase.queryGrid(index["grid"], box)]
+
+################################
+
+# Narrowphase. Returns a collision for every pair of colliders of the two objects that overlap.
+def findCollisionsBetween(uid1, obj1, uid2, obj2):
+    collisions = []
+
+    for collider1 in obj1["colliders"]:
+        for collider2 in obj2["colliders"]:
+            displacement = colliders.getDisplacement(collider1, obj1["position"], collider2, obj2["position"])
+
+            if displacement is None:
+                continue
+
+            collisions.append(makeObjectCollision(uid1, obj1, uid2, obj2, displacement))
+
+    return collisions
+
+def makeObjectCollision(uid1, obj1, uid2, obj2, displacement):
+    return [{
+        "uid": uid1,
+        "velocity": obj1["velocity"],
+        "mass": obj1["mass"],
+        "displacement": displacement
+    }, {
+        "uid": uid2,
+        "velocity": obj2["velocity"],
+        "mass": obj2["mass"],
+        "displacement": -displacement
+    }]
+
+# The original all-pairs search. Kept as a reference to compare the broadphase results against.
+# With an index only the objects in it are tested, so the inactive ones are left out like with the other broadphases.
+def findObjectCollisionsBruteForce(objects, index=None):
     collisions = []
+    active = None if index is None else set(numpy.asarray(index["uids"]).tolist())
 
     for uid1, obj1 in objects.items():
-        if not checkObjectProperties(obj1):
-            continue  # Skip objects without a collider or a velocity
+        if not checkObjectProperties(obj1) or (active is not None and uid1 not in active):
+            continue  # Skip objects without a collider or a velocity and inactive ones
 
         for uid2, obj2 in objects.items():
-            if uid1 == uid2 or not checkObjectProperties(obj2):
-                continue  # Skip same object and objects without a collider or a velocity
+            if uid1 == uid2 or not checkObjectProperties(obj2) or (active is not None and uid2 not in active):
+                continue  # Skip same object, objects without a collider or a velocity and inactive ones
 
             # Check if the potential collision has been registered before
             collisionFound = True
@@ -74,122 +400,447 @@ def findObjectCollisions(objects):
             if not collisionFound:
                 continue
 
-            for collider1 in obj1["colliders"]:
-                for collider2 in obj2["colliders"]:
-                    pos1 = obj1["position"] + collider1["position"]
-                    pos2 = obj2["position"] + collider2["position"]
-                    r1 = collider1["radius"]
-                    r2 = collider2["radius"]
+            collisions += findCollisionsBetween(uid1, obj1, uid2, obj2)
+
+    return collisions
+
+def findObjectCollisions(objects, method=None, index=None):
+    if method is None:
+        method = BROADPHASE
 
-                    if not checkCollisionCircleCircle(pos1, r1, pos2, r2):
-                        continue
+    if method == "bruteforce":
+        return findObjectCollisionsBruteForce(objects, index)
 
-                    displacement = getDisplacementCircleCircle(pos1, r1, pos2, r2)
+    if index is None:
+        index = buildIndex(objects)
 
-                    collision = [{
-                        "uid": uid1,
-                        "velocity": obj1["velocity"],
-                        "mass": obj1["mass"],
-                        "displacement": displacement
-                    }, {
-                        "uid": uid2,
-                        "velocity": obj2["velocity"],
-                        "mass": obj2["mass"],
-                        "displacement": -displacement
-                    }]
+    if "slots" in index:
+        return findWorldCollisions(objects, method, index)
 
-                    collisions.append(collision)
+    collisions = []
+
+    # The pairs come sorted in iteration order, so the collisions end up in the same order as with brute force
+    for uid1, uid2 in getIndexPairs(index, method):
+        if uid1 not in objects or uid2 not in objects:
+            continue  # Removed since the index was built
+
+        obj1 = objects[uid1]
+        obj2 = objects[uid2]
+        if checkObjectProperties(obj1) and checkObjectProperties(obj2):
+            collisions += findCollisionsBetween(uid1, obj1, uid2, obj2)
 
     return collisions
 
 
-def findBoundaryCollisions(objects, bounds):
+# The candidate pairs of the index of a world.World as the slots of both objects, along with which of them are
+# between two single centered circles and which are between other objects that take part in collisions.
+# The circle pairs can be tested in batches from the positions and extents, the others go through the same tests as
+# any other objects. Pairs with an object removed since the index was built are in neither.
+def getWorldPairs(objects, index, method):
+    first, second = getIndexPairArrays(index, method)
+    slots = getIndexSlots(objects, index)
+    slots1 = slots[first]
+    slots2 = slots[second]
+
+    # checkObjectProperties() from the flags, with a 0 at the end for slot -1
+    flags = numpy.append(objects.flags[:objects.count], 0)
+    solid = (flags & SOLID == SOLID) & (flags & world.IS_SENSOR == 0)
+    circle = solid & (flags & world.IS_CIRCLE != 0)
+
+    circles = circle[slots1] & circle[slots2]
+    return slots1, slots2, circles, solid[slots1] & solid[slots2] & ~circles
+
+# findObjectCollisions() for a world.World. Circles are tested in one go, with the same operations as
+# colliders.getDisplacementCircleCircle(), and the collisions come in the same order as with the other objects.
+def findWorldCollisions(objects, method, index):
+    slots1, slots2, circles, others = getWorldPairs(objects, index, method)
+    found = {}  # Position in the pair list -> collisions
+
+    pairs = numpy.flatnonzero(circles)
+    radius = objects.extent[slots1[pairs], 2] + objects.extent[slots2[pairs], 2]
+    difference = objects.position[slots1[pairs]] - objects.position[slots2[pairs]]
+    distanceSquared = difference[:, 0] * difference[:, 0] + difference[:, 1] * difference[:, 1]
+
+    touching = distanceSquared < radius * radius
+    pairs = pairs[touching]
+    radius = radius[touching]
+    difference = difference[touching]
+    distance = numpy.sqrt(distanceSquared[touching])
+
+    displacement = numpy.empty((len(pairs), 2))
+    apart = distance > 0
+    # Like pygame.Vector2 divides, by multiplying with the reciprocal
+    displacement[apart] = difference[apart] * (1 / distance[apart, None]) * (radius - distance)[apart, None] * 0.5
+    displacement[~apart] = 0
+    displacement[~apart, 1] = -radius[~apart] / 2  # Exactly on top of each other, pick a direction
+
+    for k, uid1, uid2, push in zip(pairs.tolist(), objects.uids[slots1[pairs]].tolist(),
+                                   objects.uids[slots2[pairs]].tolist(), displacement.tolist()):
+        found[k] = [makeObjectCollision(uid1, objects[uid1], uid2, objects[uid2], pygame.Vector2(push))]
+
+    for k in numpy.flatnonzero(others).tolist():
+        uid1 = int(objects.uids[slots1[k]])
+        uid2 = int(objects.uids[slots2[k]])
+        found[k] = findCollisionsBetween(uid1, objects[uid1], uid2, objects[uid2])
+
     collisions = []
+    for k in sorted(found):
+        collisions += found[k]
 
-    for uid, obj in objects.items():
-        if not checkObjectProperties(obj):
-            continue  # Skip objects without a collider or a velocity
+    return collisions
+
+
+# Finds the pairs of objects that move fast enough to pass through each other within dt and would touch during it.
+# Only circles are swept, boxes are left to the overlap tests.
+# Returns (time of impact, uid1, uid2, collision normal) tuples ordered by the time of impact.
+# Called before the objects are moved, with an index built for the same dt.
+def findTimesOfImpact(objects, dt, method=None, index=None):
+    if method is None or method == "bruteforce":
+        method = BROADPHASE if BROADPHASE != "bruteforce" else "grid"
+
+    if index is None:
+        index = buildIndex(objects, dt)
 
-        finalDisplacement = pygame.Vector2(0, 0)
+    if "slots" in index:
+        return findWorldTimesOfImpact(objects, dt, method, index)
 
-        for collider in obj["colliders"]:
-            pos = obj["position"] + collider["position"]
-            radius = collider["radius"]
-            displacement = pygame.Vector2(0, 0)
+    impacts = []
 
-            # Not using elif here and using +=, because a circle might intersect multiple borders (at a corner)
+    for uid1, uid2 in getIndexPairs(index, method):
+        if uid1 not in objects or uid2 not in objects:
+            continue
 
-            if pos.x - radius < bounds.x:
-                displacement += pygame.Vector2(radius - pos.x + bounds.x, 0)
+        obj1 = objects[uid1]
+        obj2 = objects[uid2]
+        if not checkObjectProperties(obj1) or not checkObjectProperties(obj2):
+            continue
 
-            if pos.x + radius > bounds.w:
-                displacement += pygame.Vector2(bounds.w - pos.x - radius, 0)
+        impact = findTimeOfImpact(uid1, obj1, uid2, obj2, dt)
+        if impact is not None:
+            impacts.append(impact)
 
-            if pos.y - radius < bounds.y:
-                displacement += pygame.Vector2(0, radius - pos.y + bounds.y)
+    impacts.sort(key=lambda impact: impact[0])
+    return impacts
 
-            if pos.y + radius > bounds.h:
-                displacement += pygame.Vector2(0, bounds.h - pos.y - radius)
 
-            if abs(displacement.x) > abs(finalDisplacement.x):
-                finalDisplacement.x = displacement.x
+# The earliest impact between the circles of two objects within dt, or None
+def findTimeOfImpact(uid1, obj1, uid2, obj2, dt):
+    velocity1 = pygame.Vector2(obj1["velocity"])
+    velocity2 = pygame.Vector2(obj2["velocity"])
+    travel = (velocity1 - velocity2).length() * dt
 
-            if abs(displacement.y) > abs(finalDisplacement.y):
-                finalDisplacement.y = displacement.y
+    first = None
 
-        # No collisions with borders
-        if finalDisplacement.length_squared() < 0.001:
+    for collider1 in obj1["colliders"]:
+        for collider2 in obj2["colliders"]:
+            if not colliders.isCircle(collider1) or not colliders.isCircle(collider2):
+                continue
+
+            # Slow enough that the overlap test at the end of the step can't miss it
+            if travel <= min(collider1["radius"], collider2["radius"]):
+                continue
+
+            pos1 = obj1["position"] + collider1["position"]
+            pos2 = obj2["position"] + collider2["position"]
+            t = sweepCircleCircle(pos1, velocity1, collider1["radius"], pos2, velocity2, collider2["radius"], dt)
+
+            if t is not None and (first is None or t < first[0]):
+                normal = (pos1 + velocity1 * t) - (pos2 + velocity2 * t)
+                first = (t, uid1, uid2, normal)
+
+    return first
+
+
+# findTimesOfImpact() for a world.World. The circles are swept in one go, with the same operations as
+# sweepCircleCircle().
+def findWorldTimesOfImpact(objects, dt, method, index):
+    slots1, slots2, circles, others = getWorldPairs(objects, index, method)
+    found = []  # (position in the pair list, impact)
+
+    pairs = numpy.flatnonzero(circles)
+    radius1 = objects.extent[slots1[pairs], 2]
+    radius2 = objects.extent[slots2[pairs], 2]
+    velocity1 = objects.velocity[slots1[pairs]]
+    velocity2 = objects.velocity[slots2[pairs]]
+    v = velocity1 - velocity2
+    a = v[:, 0] * v[:, 0] + v[:, 1] * v[:, 1]
+
+    # Slow enough that the overlap test at the end of the step can't miss it
+    fast = numpy.sqrt(a) * dt > numpy.minimum(radius1, radius2)
+
+    d = objects.position[slots1[pairs]] - objects.position[slots2[pairs]]
+    b = 2 * (d[:, 0] * v[:, 0] + d[:, 1] * v[:, 1])
+    c = d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1] - (radius1 + radius2) * (radius1 + radius2)
+    discriminant = b * b - 4 * a * c
+
+    hit = numpy.flatnonzero(fast & (c > 0) & (a != 0) & (discriminant >= 0))
+    t = (-b[hit] - numpy.sqrt(discriminant[hit])) / (2 * a[hit])
+    inStep = (0 <= t) & (t <= dt)
+    hit = hit[inStep]
+    t = t[inStep]
+
+    normal = (objects.position[slots1[pairs[hit]]] + velocity1[hit] * t[:, None]) - \
+        (objects.position[slots2[pairs[hit]]] + velocity2[hit] * t[:, None])
+
+    pairs = pairs[hit]
+    for k, time, uid1, uid2, direction in zip(pairs.tolist(), t.tolist(), objects.uids[slots1[pairs]].tolist(),
+                                              objects.uids[slots2[pairs]].tolist(), normal.tolist()):
+        found.append((k, (time, uid1, uid2, pygame.Vector2(direction))))
+
+    for k in numpy.flatnonzero(others).tolist():
+        uid1 = int(objects.uids[slots1[k]])
+        uid2 = int(objects.uids[slots2[k]])
+        impact = findTimeOfImpact(uid1, objects[uid1], uid2, objects[uid2], dt)
+        if impact is not None:
+            found.append((k, impact))
+
+    # Ordered like the pairs first, so that impacts at the same time stay in that order
+    found.sort(key=lambda item: item[0])
+    impacts = [impact for k, impact in found]
+    impacts.sort(key=lambda impact: impact[0])
+    return impacts
+
+
+# Resolves the impacts found by findTimesOfImpact() after the objects have been moved by dt.
+# Both objects are put back to where they touched, bounce and move on with their new velocities for the rest of the
+# step. An object takes part in at most one impact per step, the earliest one; anything later is left to the overlap
+# tests and the next step. Returns the resolved collisions.
+def resolveTimesOfImpact(objects, impacts, dt):
+    resolved = []
+    moved = set()
+
+    for t, uid1, uid2, normal in impacts:
+        if uid1 in moved or uid2 in moved or normal.length_squared() == 0:
             continue
 
+        obj1 = objects[uid1]
+        obj2 = objects[uid2]
+
         collision = [{
-            "uid": uid,
-            "velocity": obj["velocity"],
-            "mass": obj["mass"],
-            "displacement": finalDisplacement
-        }, {  # An immovable wall with infinite mass
-            "uid": -1,
-            "velocity": pygame.Vector2(0, 0),
-            "mass": 1000000000,
-            "displacement": pygame.Vector2(0, 0)
+            "uid": uid1,
+            "velocity": pygame.Vector2(obj1["velocity"]),
+            "mass": obj1["mass"],
+            "displacement": normal
+        }, {
+            "uid": uid2,
+            "velocity": pygame.Vector2(obj2["velocity"]),
+            "mass": obj2["mass"],
+            "displacement": -normal
         }]
 
-        collisions.append(collision)
+        velocities = solveCollision(collision)
+
+        for side, velocity in zip(collision, velocities):
+            obj = objects[side["uid"]]
+            contact = obj["position"] - side["velocity"] * (dt - t)
+            obj["position"] = contact + velocity * (dt - t)
+            obj["velocity"] = velocity
+
+        moved.add(uid1)
+        moved.add(uid2)
+        resolved.append(collision)
+
+    return resolved
+
+
+# A collision of the object with an immovable wall of infinite mass
+def makeWallCollision(uid, obj, displacement):
+    return [{
+        "uid": uid,
+        "velocity": obj["velocity"],
+        "mass": obj["mass"],
+        "displacement": displacement
+    }, {
+        "uid": -1,
+        "velocity": pygame.Vector2(0, 0),
+        "mass": 1000000000,
+        "displacement": pygame.Vector2(0, 0)
+    }]
+
+
+# Wall collisions for the slots and pushes returned by world.World.findWallPushes() and collideWithWalls()
+def makeWallCollisions(world, slots, pushes):
+    collisions = []
+
+    for slot, push in zip(slots, pushes):
+        uid = int(world.uids[slot])
+        collisions.append(makeWallCollision(uid, world[uid], pygame.Vector2(float(push[0]), float(push[1]))))
 
     return collisions
 
 
-def update(dt, objects, bounds, eventType):
-    # Movement
+# A world.World finds the objects sticking out of the bounds in one go from the collider extents it has cached.
+# Anything else gets the bounds of each object computed here, and an object inside the bounds is skipped after
+# four comparisons.
+# An object entirely outside the bounds and moving towards them is inactive: nothing inside can touch it and the walls
+# let it in. Objects spawned above the screen stay in this tier until they reach the play area.
+def findBoundaryCollisions(objects, bounds):
+    if hasattr(objects, "findWallPushes"):
+        return makeWallCollisions(objects, *objects.findWallPushes(bounds.left, bounds.top, bounds.right, bounds.bottom))
+
+    collisions = []
+
     for uid, obj in objects.items():
-        if "velocity" not in obj:
-            continue  # Skip objects without a velocity
+        if not checkObjectProperties(obj):
+            continue  # Skip objects without a collider or a velocity
+
+        minX, minY, maxX, maxY = getObjectBounds(obj)
+        if bounds.left <= minX and maxX <= bounds.right and bounds.top <= minY and maxY <= bounds.bottom:
+            continue  # No collisions with borders
 
-        obj["position"] += obj["velocity"] * dt
+        # Not using elif here, because an object might intersect multiple borders (at a corner)
+        displacement = pygame.Vector2(max(bounds.left - minX, 0) + min(bounds.right - maxX, 0),
+                                      max(bounds.top - minY, 0) + min(bounds.bottom - maxY, 0))
 
-    circleCollisions = findObjectCollisions(objects)
-    boundaryCollisions = findBoundaryCollisions(objects, bounds)
+        if displacement.length_squared() < 0.001:
+            continue
 
-    collisions = circleCollisions + boundaryCollisions
+        outside = not broadphase.overlaps((minX, minY, maxX, maxY), (bounds.left, bounds.top, bounds.right, bounds.bottom))
+        if outside and displacement.dot(obj["velocity"]) > 0:
+            continue  # Inactive
+
+        collisions.append(makeWallCollision(uid, obj, displacement))
+
+    return collisions
+
+
+################################
+# Contact islands
+
+# Splits the collisions into contact islands, the groups of objects that touch each other directly or through other
+# objects. No object is in two islands, so the islands can be solved separately, in any order or in parallel.
+# Walls (uid -1) don't join islands together. The collisions keep their order within an island.
+def findIslands(collisions):
+    parent = {}
+
+    def find(uid):
+        parent.setdefault(uid, uid)
+        while parent[uid] != uid:
+            parent[uid] = parent[parent[uid]]
+            uid = parent[uid]
+        return uid
 
-    # Collision response
     for collision in collisions:
-        velocities = solveCollision(collision)
+        uid1 = collision[0]["uid"]
+        uid2 = collision[1]["uid"]
+        if uid1 >= 0 and uid2 >= 0:
+            parent[find(uid1)] = find(uid2)
+
+    islands = {}
+
+    for collision in collisions:
+        uid = collision[0]["uid"] if collision[0]["uid"] >= 0 else collision[1]["uid"]
+        islands.setdefault(find(uid), []).append(collision)
+
+    return list(islands.values())
+
+
+# The contact islands of a world.World, from the slots of both objects of every contact (-1 for a wall). Every contact
+# is labelled with the lowest slot in its island, found by spreading the lower label across every contact until the two
+# objects of each contact agree. Islands are usually small, so that takes a few passes.
+def labelIslands(slots1, slots2, count):
+    label = numpy.arange(count)
+    both = (slots1 >= 0) & (slots2 >= 0)
+    first = slots1[both]
+    second = slots2[both]
+
+    while True:
+        lower = numpy.minimum(label[first], label[second])
+        if numpy.array_equal(lower, label[first]) and numpy.array_equal(lower, label[second]):
+            break
+
+        numpy.minimum.at(label, first, lower)
+        numpy.minimum.at(label, second, lower)
+        label = label[label]  # A label is a slot of the same island, and that slot's label is as good or lower
+
+    return label[numpy.where(slots1 >= 0, slots1, slots2)]
+
+
+# Solves one collision in place, moving the objects apart and setting their new velocities
+def resolveCollision(objects, collision):
+    velocities = solveCollision(collision)
+
+    for side, velocity in zip(collision, velocities):
+        if side["uid"] < 0:
+            continue  # Walls don't move
+
+        # Move the objects away a bit more than just the displacement to avoid very small collisions
+        displacement = (side["displacement"].length() + 0.01) * side["displacement"].normalize()
+        objects[side["uid"]]["position"] += displacement
+        objects[side["uid"]]["velocity"] = velocity
+
+
+# Collision response island by island. The collisions of an island are solved one after another.
+# A world.World is solved by applyCollisions() instead, which works through its islands in one batch.
+def solveIslands(objects, islands):
+    for island in islands:
+        for collision in island:
+            resolveCollision(objects, collision)
+
+################################
+
+# The index can be the one the game rules already built this frame with the same dt, otherwise a new one is built.
+# Either way only the objects that can reach the bounds during dt are tested against each other.
+# The collisions between objects go into the events buffer (an events.CollisionBuffer) if there is one, and are posted
+# as pygame events of the given type if the type isn't None.
+def update(dt, objects, bounds, eventType, broadphaseMethod=None, continuous=None, index=None, events=None):
+    if continuous is None:
+        continuous = CONTINUOUS
+
+    if index is None:
+        index = buildIndex(objects, dt, bounds)
+
+    impacts = findTimesOfImpact(objects, dt, broadphaseMethod, index) if continuous else []
+
+    # Movement
+    if hasattr(objects, "integrate"):
+        objects.integrate(dt)  # A world.World, moves everything in one go
+    else:
+        for uid, obj in objects.items():
+            if "velocity" not in obj:
+                continue  # Skip objects without a velocity
+
+            obj["position"] += obj["velocity"] * dt
+
+    impactCollisions = resolveTimesOfImpact(objects, impacts, dt)
+    if impactCollisions:
+        updateIndex(index, objects, [side["uid"] for collision in impactCollisions for side in collision])
+
+    collisions = findObjectCollisions(objects, broadphaseMethod, index)
+
+    # A world.World does the walls in a batch pass of their own. They come last, so that nothing gets pushed out again
+    # by an object collision.
+    if not hasattr(objects, "collideWithWalls"):
+        collisions += findBoundaryCollisions(objects, bounds)
+
+    # Collision response
+    if hasattr(objects, "integrate"):
+        applyCollisions(objects, collisions)
+    else:
+        solveIslands(objects, findIslands(collisions))
+
+    if events is not None:
+        events.extend(impactCollisions)
+        events.extend(collisions)
+
+    if eventType is not None:
+        for collision in impactCollisions + collisions:
+            emitCollisionEvent(collision, eventType)
+
+    if hasattr(objects, "collideWithWalls"):
+        collisions += makeWallCollisions(objects, *objects.collideWithWalls(bounds.left, bounds.top,
+                                                                            bounds.right, bounds.bottom))
+
+    return impactCollisions + collisions
 
-        if collision[0]["uid"] >= 0:
-            # Move the objects away a bit more than just the displacement to avoid very small collisions
-            displacement = (collision[0]["displacement"].length() + 0.01) * collision[0]["displacement"].normalize()
-            objects[collision[0]["uid"]]["position"] += displacement
-            objects[collision[0]["uid"]]["velocity"] = velocities[0]
 
-        if collision[1]["uid"] >= 0:
-            # Move the objects away a bit more than just the displacement to avoid very small collisions
-            displacement = (collision[1]["displacement"].length() + 0.01) * collision[1]["displacement"].normalize()
-            objects[collision[1]["uid"]]["position"] += displacement
-            objects[collision[1]["uid"]]["velocity"] = velocities[1]
+# Posts a pygame event for a collision between two objects. No event type means nobody is listening.
+def emitCollisionEvent(collision, eventType):
+    if eventType is None:
+        return
 
-        # Emit collision event
-        if collision[0]["uid"] >= 0 and collision[1]["uid"] >= 0:
-            attributes = {"uid1": collision[0]["uid"], "uid2": collision[1]["uid"]}
-            collisionEvent = pygame.event.Event(eventType, attributes)
+    if collision[0]["uid"] >= 0 and collision[1]["uid"] >= 0:
+        attributes = {"uid1": collision[0]["uid"], "uid2": collision[1]["uid"]}
+        collisionEvent = pygame.event.Event(eventType, attributes)
 
-            pygame.event.post(collisionEvent)
\ No newline at end of file
+        pygame.event.post(collisionEvent)
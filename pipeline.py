@@ -0,0 +1,72 @@
+# Runs the simulation on a worker thread while the main thread draws.
+# The program loop waits for the worker at the start of every frame, which is the only point where both threads meet:
+# the main thread then takes a copy of the state to draw (see main.capture()), handles the input and hands the worker
+# the next steps. The worker simulates them while the main thread draws the copy, so what is on the screen is at most
+# one frame behind the input.
+#
+# How much this gains is limited by the GIL, which the worker only lets go of in NumPy array operations. For a
+# world.World those do most of a physics step: the movement, the index and its pairs, the narrowphase and time of
+# impact tests between single circles, the collision response and the walls. What is left in plain Python is the
+# bookkeeping of every contact found (the collision dictionaries, the impacts and the events), the other collider
+# shapes, the game rules and the spawning, and while that runs the main thread can't draw. At around 7000 asteroids
+# that bookkeeping is about a third of a physics step. On a single core the threads can't overlap at all and trading
+# the GIL back and forth makes a frame take twice as long as the plain loop, so there the loop doesn't use a Pipeline.
+
+import os
+import threading
+
+
+# Whether there is more than one core for the threads to run on
+def worthwhile():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) > 1
+    return (os.cpu_count() or 1) > 1
+
+
+class Pipeline:
+    def __init__(self):
+        self.job = None
+        self.error = None
+        self.started = threading.Event()
+        self.done = threading.Event()
+        self.done.set()
+        self.running = True
+
+        self.thread = threading.Thread(target=self.run, name="simulation", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            self.started.wait()
+            self.started.clear()
+
+            if not self.running:
+                return
+
+            try:
+                self.job()
+            except Exception as error:
+                self.error = error  # Raised on the main thread by wait()
+
+            self.job = None
+            self.done.set()
+
+    # Starts job() on the worker. The previous job must have been waited for.
+    def submit(self, job):
+        self.done.clear()
+        self.job = job
+        self.started.set()
+
+    # Blocks until the worker has finished its job, after which the state is safe to touch again
+    def wait(self):
+        self.done.wait()
+
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def stop(self):
+        self.wait()
+        self.running = False
+        self.started.set()
+        self.thread.join()
@@ -0,0 +1,165 @@
+# Per-frame instrumentation.
+# The program loop calls begin_frame(), then lap() after every stage and end_frame() at the end. Every lap records the
+# time since the previous one, so the stages of a frame add up to the whole frame.
+# The last frames are kept for the on-screen overlay, frames over the budget are kept separately, and both can be
+# dumped to CSV or JSON for looking at slow frames offline.
+# While disabled every call returns immediately, so the instrumentation can stay in the loop.
+# Only the thread running the program loop is timed. Laps from the simulation thread of a pipelined loop are ignored,
+# its time shows up as the main thread waiting for it.
+
+import collections
+import csv
+import json
+import threading
+import time
+
+FRAME_BUDGET = 1 / 60  # Frames taking longer than this in seconds are counted as slow
+
+enabled = False
+overlay = False  # Whether draw() shows the averages on the screen
+
+frames = collections.deque(maxlen=600)  # The most recent frames, each a dictionary of stage times and counters
+slow_frames = collections.deque(maxlen=1000)
+
+frame_number = 0
+current = None
+last_time = 0
+thread = None  # The thread that began the current frame
+
+
+def enable(history=600):
+    global enabled, frames
+
+    if frames.maxlen != history:
+        frames = collections.deque(frames, maxlen=history)
+
+    enabled = True
+
+
+def disable():
+    global enabled, current, overlay
+
+    enabled = False
+    overlay = False
+    current = None
+
+
+# Forgets the recorded frames, e.g. between runs of the batch runner
+def reset():
+    global frame_number, current
+
+    frames.clear()
+    slow_frames.clear()
+    frame_number = 0
+    current = None
+
+
+def toggle_overlay():
+    global overlay
+
+    if overlay:
+        disable()
+    else:
+        enable()
+        overlay = True
+
+
+def begin_frame():
+    global current, last_time, frame_number, thread
+
+    if not enabled:
+        return
+
+    thread = threading.get_ident()
+    frame_number += 1
+    current = {"frame": frame_number}
+    last_time = time.perf_counter()
+
+
+# Adds the time since the previous lap to the stage. The index tells apart repeated stages such as physics substeps.
+def lap(stage, index=None):
+    global last_time
+
+    if current is None or threading.get_ident() != thread:
+        return
+
+    now = time.perf_counter()
+    key = stage if index is None else f"{stage}[{index}]"
+    current[key] = current.get(key, 0) + (now - last_time) * 1000  # In milliseconds
+    last_time = now
+
+
+# Adds to a per-frame counter, e.g. the number of collisions
+def count(name, value):
+    if current is None or threading.get_ident() != thread:
+        return
+
+    current[name] = current.get(name, 0) + value
+
+
+def end_frame(**counters):
+    global current
+
+    if current is None:
+        return
+
+    current.update(counters)
+    current["total"] = sum(value for key, value in current.items() if is_stage(key))
+
+    frames.append(current)
+    if current["total"] > FRAME_BUDGET * 1000:
+        slow_frames.append(current)
+
+    current = None
+
+
+STAGE_COUNTERS = ("frame", "total", "objects", "bullets", "collisions")
+
+def is_stage(key):
+    return key not in STAGE_COUNTERS
+
+################################
+
+# Average of every stage and counter over the recorded frames
+def averages():
+    sums = collections.defaultdict(float)
+
+    for frame in frames:
+        for key, value in frame.items():
+            if key != "frame":
+                sums[key] += value
+
+    return {key: value / len(frames) for key, value in sums.items()}
+
+
+# Text lines for the overlay, slowest stages first
+def overlay_lines():
+    if not frames:
+        return []
+
+    average = averages()
+    stages = sorted((key for key in average if is_stage(key)), key=lambda key: -average[key])
+
+    lines = [f"frame {average['total']:.2f} ms  ({len(slow_frames)} slow)"]
+    lines += [f"{key} {average[key]:.2f} ms" for key in stages]
+    lines += [f"{key} {average[key]:.0f}" for key in ("objects", "bullets", "collisions") if key in average]
+
+    return lines
+
+
+# Writes the recorded frames, or only the slow ones, to a .csv or .json file
+def dump(path, slow_only=False):
+    rows = list(slow_frames if slow_only else frames)
+    keys = []
+    for row in rows:
+        keys += [key for key in row if key not in keys]
+
+    with open(path, "w", newline="") as file:
+        if path.endswith(".json"):
+            json.dump({"budget_ms": FRAME_BUDGET * 1000, "frames": rows}, file, indent=1)
+        else:
+            writer = csv.DictWriter(file, fieldnames=keys, restval=0)
+            writer.writeheader()
+            writer.writerows(rows)
+
+    return len(rows)
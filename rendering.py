@@ -0,0 +1,92 @@
+# Optional dirty rectangle rendering.
+# Instead of drawing the whole background and flipping the whole window every frame, only the areas where something
+# was drawn last frame are restored from the background and only those plus this frame's areas are sent to the
+# display with pygame.display.update(rects). Pages that don't change aren't redrawn at all.
+# When too much of the screen is dirty a full redraw is cheaper, so it falls back to that.
+#
+# draw() calls begin() first, passes the rectangle of everything it draws to mark() and the program loop calls
+# present() instead of pygame.display.flip().
+
+import pygame
+
+FULL_REDRAW_FRACTION = 0.5  # Redraw everything when more than this part of the screen is dirty
+STATIC_PAGES = {"intro", "how_to_play", "game_over"}  # Pages that look the same every frame
+
+
+def create(enabled=False):
+    return {
+        "enabled": enabled,
+        "page": None,  # The page drawn last frame
+        "previous": [],  # What was drawn last frame
+        "current": [],  # What has been drawn this frame
+        "full": True,  # Whether this frame is a full redraw
+        "skip": False  # Whether this frame draws nothing at all
+    }
+
+
+def toggle(renderer):
+    renderer["enabled"] = not renderer["enabled"]
+    invalidate(renderer)
+
+
+# Makes the next frame a full redraw, e.g. after the background has changed
+def invalidate(renderer):
+    renderer["page"] = None
+
+
+def area(rects):
+    return sum(rect.w * rect.h for rect in rects)
+
+
+def too_dirty(rects, screen):
+    return area(rects) > FULL_REDRAW_FRACTION * screen.get_width() * screen.get_height()
+
+
+def erase(screen, background, rect=None):
+    if background is not None:
+        screen.blit(background, rect or (0, 0), rect)
+    else:
+        screen.fill((0, 0, 0), rect)
+
+
+# Prepares the screen for drawing the frame. Returns False when the frame looks the same as the previous one and
+# nothing needs to be drawn.
+def begin(renderer, screen, background, page):
+    renderer["current"] = []
+    renderer["skip"] = False
+
+    if not renderer["enabled"] or page != renderer["page"] or too_dirty(renderer["previous"], screen):
+        renderer["full"] = True
+        erase(screen, background)
+    elif page in STATIC_PAGES:
+        renderer["skip"] = True
+        return False
+    else:
+        renderer["full"] = False
+        for rect in renderer["previous"]:
+            erase(screen, background, rect)
+
+    renderer["page"] = page
+    return True
+
+
+# Records a rectangle that was drawn to this frame and returns it
+def mark(renderer, rect):
+    if renderer["enabled"]:
+        renderer["current"].append(rect)
+
+    return rect
+
+
+# Sends the frame to the display
+def present(renderer):
+    if renderer["skip"]:
+        return
+
+    rects = renderer["previous"] + renderer["current"]
+    renderer["previous"] = renderer["current"]
+
+    if renderer["full"] or too_dirty(rects, pygame.display.get_surface()):
+        pygame.display.flip()
+    else:
+        pygame.display.update(rects)
@@ -0,0 +1,163 @@
+#! /usr/bin/python3
+# Recording games into compact binary logs and playing them back.
+# A game is fully determined by the seed of its random numbers, the dt of every frame, the keys update_player() looks
+# at and the bullets fired, so that is all a log holds:
+#   header: magic, version, seed, substeps, spawn mode (see waves.MODES)
+#   one record per frame: dt, a bit per key in KEYS, how many bullets were fired before the frame
+# Playing a log back goes through main.step() exactly like the recorded game did, either in real time or as fast as
+# the CPU allows without drawing anything.
+#
+# Usage: python replay.py FILE [--realtime] [--render] [--profile FILE]
+
+import argparse
+import collections
+import os
+import struct
+import time
+
+import pygame
+
+import profiler
+import rendering
+
+MAGIC = b"ASGR"
+VERSION = 3
+HEADER = struct.Struct("<4sHQH16s")  # magic, version, seed, substeps, spawn mode
+FRAME = struct.Struct("<dBB")  # dt, key bits, fires
+
+# The keys the game reads every frame, one bit each in this order
+KEYS = (pygame.K_w, pygame.K_s, pygame.K_a, pygame.K_d)
+
+BUFFER_SIZE = 1 << 16  # Bytes collected before they are written to the file
+
+
+def pack_keys(keys):
+    bits = 0
+    for i, key in enumerate(KEYS):
+        if keys[key]:
+            bits |= 1 << i
+    return bits
+
+
+def unpack_keys(bits):
+    return collections.defaultdict(bool, {key: True for i, key in enumerate(KEYS) if bits & 1 << i})
+
+
+class Recorder:
+    def __init__(self, path, seed, substeps, mode):
+        # A large buffer keeps the writes rare, the frames themselves only append a few bytes to it
+        self.file = open(path, "wb", buffering=BUFFER_SIZE)
+        self.file.write(HEADER.pack(MAGIC, VERSION, seed, substeps, mode.encode()))
+        self.path = path
+        self.fires = 0
+
+    # Called for every bullet fired, the fires are stored with the next frame
+    def fire(self):
+        self.fires += 1
+
+    def frame(self, dt, keys):
+        self.file.write(FRAME.pack(dt, pack_keys(keys), min(self.fires, 255)))
+        self.fires = 0
+
+    def close(self):
+        self.file.close()
+
+
+# Returns the header as a dictionary and an iterator over the (dt, keys, fires) of every frame
+def read(path):
+    with open(path, "rb") as file:
+        data = file.read()
+
+    magic, version, seed, substeps, mode = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} replay")
+
+    header = {"seed": seed, "substeps": substeps, "mode": mode.rstrip(b"\0").decode()}
+    frames = ((dt, unpack_keys(bits), fires) for dt, bits, fires in FRAME.iter_unpack(data[HEADER.size:]))
+
+    return header, frames
+
+
+# Plays a recorded game in main.state and returns a summary of it like headless.run() does.
+# With render=True every frame is drawn, which needs a window. With realtime=True every frame takes as long as it did
+# when it was recorded.
+def play(path, realtime=False, render=False):
+    import main  # Imported here, because main imports this module for recording
+
+    header, frames = read(path)
+
+    if render:
+        pygame.display.init()
+    state = main.state = main.create_state(header["seed"], headless=not render, substeps=header["substeps"],
+                                           spawn_mode=header["mode"])
+    state["page"] = "game"
+    main.reset_game_state()
+
+    start_time = time.perf_counter()
+    frame = 0
+    survival_time = 0
+
+    for dt, keys, fires in frames:
+        profiler.begin_frame()
+
+        state["dt"] = dt
+        for i in range(fires):
+            main.fire_bullet()
+        state["keys"] = keys
+        main.step()
+        survival_time += dt
+
+        if render:
+            pygame.event.pump()  # Keeps the window responsive
+            main.draw()
+            rendering.present(state["renderer"])
+
+        profiler.end_frame(objects=len(state["objects"]), bullets=len(state["bullets"]))
+        frame += 1
+
+        if realtime:
+            delay = start_time + survival_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        if state["page"] != "game":
+            break
+
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        "seed": header["seed"],
+        "frames": frame,
+        "game_over": state["page"] == "game_over",
+        "survival_time": survival_time,
+        "score": state["score"],
+        "objects": len(state["objects"]),
+        "bullets": len(state["bullets"]),
+        "wall_time": elapsed,
+        "fps": frame / elapsed if elapsed > 0 else float("inf")
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play back a recorded game")
+    parser.add_argument("file")
+    parser.add_argument("--realtime", action="store_true", help="Play at the recorded speed instead of fast-forwarding")
+    parser.add_argument("--render", action="store_true", help="Draw the game in a window")
+    parser.add_argument("--profile", metavar="FILE", help="Record per-frame timings into a .csv or .json file")
+    args = parser.parse_args()
+
+    if not args.render:
+        # Must be set before pygame is initialized
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+    if args.profile:
+        profiler.enable(history=max(os.path.getsize(args.file) // FRAME.size, 1))
+
+    result = play(args.file, args.realtime, args.render)
+
+    for key, value in result.items():
+        print(f"{key}: {value}")
+
+    if args.profile:
+        profiler.dump(args.profile)
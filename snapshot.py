@@ -0,0 +1,225 @@
+# Saving the game world into a compact binary file and loading it back.
+# A snapshot holds the objects, the bullets, the score, the spawn mode, settings and timers, the waves waiting to be
+# added and the state of the random numbers, so a game continues from it exactly like it would have from the frame it
+# was saved on.
+#
+# The file is a small header, a JSON description and then the raw arrays, each starting at a multiple of 8 bytes:
+#   the world.World.ARRAYS of the objects, their colors, tags and sensor flags, a table of all their colliders and the
+#   bullets, and the waves in the spawn queue one after another.
+# Loading memory maps the file and uses the arrays straight from it, only the per-object dictionaries of colliders,
+# colors and tags are built one by one. The arrays keep reading from the file until they are written to, so a world
+# that is loaded and then saved into the same file has to be loaded with copy=True.
+# Fields that can't be stored, like the player's image, are left out and have to be set again after loading.
+
+import json
+import math
+import mmap
+import struct
+
+import numpy
+
+import colliders
+import waves
+import world
+
+MAGIC = b"ASGS"
+VERSION = 3
+HEADER = struct.Struct("<4sHI")  # magic, version, length of the JSON description
+ALIGNMENT = 8
+
+HAS_COLOR = 1  # Bits in the "extraFlags" array
+IS_SENSOR = 2
+
+COLLIDER_TYPES = ("circle", "aabb")
+
+BULLET_DRAWN = 1
+BULLET_MARKED_FOR_REMOVAL = 2
+
+
+def align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+# The arrays of a state, by name
+def pack(state):
+    arrays, extras, uids = state["objects"].getArrays()
+    n = len(extras)
+
+    colors = numpy.zeros((n, 3), dtype=numpy.uint8)
+    extraFlags = numpy.zeros(n, dtype=numpy.uint8)
+    tagIndices = numpy.full(n, -1, dtype=numpy.int16)
+    tags = []
+
+    colliderOwners = []
+    colliderTypes = []
+    colliderData = []  # x, y and either the radius or the width and height
+
+    for i, extra in enumerate(extras):
+        if "color" in extra:
+            colors[i] = extra["color"][:3]
+            extraFlags[i] |= HAS_COLOR
+        if extra.get("sensor", False):
+            extraFlags[i] |= IS_SENSOR
+
+        if extra.get("tag") is not None:
+            if extra["tag"] not in tags:
+                tags.append(extra["tag"])
+            tagIndices[i] = tags.index(extra["tag"])
+
+        for collider in extra.get("colliders", ()):
+            x, y = collider["position"]
+            colliderOwners.append(i)
+
+            if colliders.isCircle(collider):
+                colliderTypes.append(COLLIDER_TYPES.index("circle"))
+                colliderData.append((x, y, collider["radius"], 0))
+            else:
+                colliderTypes.append(COLLIDER_TYPES.index("aabb"))
+                colliderData.append((x, y, collider["size"].x, collider["size"].y))
+
+    bullets = list(state["bullets"])
+    queue = state["spawn_queue"].waves
+
+    arrays.update({
+        "colors": colors,
+        "extraFlags": extraFlags,
+        "tags": tagIndices,
+        "colliderOwners": numpy.array(colliderOwners, dtype=numpy.int32),
+        "colliderTypes": numpy.array(colliderTypes, dtype=numpy.uint8),
+        "colliderData": numpy.array(colliderData, dtype=float).reshape(-1, 4),
+        "bulletPosition": numpy.array([tuple(bullet["position"]) for bullet in bullets], dtype=float).reshape(-1, 2),
+        "bulletVelocity": numpy.array([tuple(bullet["velocity"]) for bullet in bullets], dtype=float).reshape(-1, 2),
+        "bulletFlags": numpy.array([(BULLET_DRAWN if bullet["drawn"] else 0) |
+                                    (BULLET_MARKED_FOR_REMOVAL if bullet["marked_for_removal"] else 0)
+                                    for bullet in bullets], dtype=numpy.uint8),
+        "waveLengths": numpy.array([len(wave["radius"]) for wave in queue], dtype=numpy.int64),
+        "wavePosition": numpy.concatenate([wave["position"] for wave in queue] or [numpy.zeros((0, 2))]),
+        "waveVelocity": numpy.concatenate([wave["velocity"] for wave in queue] or [numpy.zeros((0, 2))]),
+        "waveRadius": numpy.concatenate([wave["radius"] for wave in queue] or [numpy.zeros(0)]),
+        "waveColor": numpy.concatenate([wave["color"] for wave in queue] or [numpy.zeros(0, dtype=numpy.int64)])
+    })
+
+    player = numpy.flatnonzero(uids == state.get("player_uid", -1))
+
+    description = {
+        "objects": n,
+        "player": int(player[0]) if len(player) else -1,
+        "tags": tags,
+        "score": state["score"],
+        "spawn_mode": state["spawn_mode"],
+        "spawn_settings": {key: state[key] for key in waves.MODES[state["spawn_mode"]]},
+        "spawn_timer": state["spawn_timer"],
+        "wave": state["wave"],
+        "rng": state["rng"].getstate()
+    }
+
+    return arrays, description
+
+
+def save(path, state):
+    arrays, description = pack(state)
+
+    offset = 0
+    description["arrays"] = []
+    for name, array in arrays.items():
+        description["arrays"].append([name, array.dtype.str, array.shape, offset])
+        offset = align(offset + array.nbytes)
+
+    text = json.dumps(description).encode()
+    start = align(HEADER.size + len(text))
+
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(text)))
+        file.write(text)
+
+        for name, dtype, shape, offset in description["arrays"]:
+            file.write(bytes(start + offset - file.tell()))  # Padding
+            file.write(numpy.ascontiguousarray(arrays[name]).data)
+
+
+# The arrays and the description of a snapshot file. The arrays are views of a private memory map of the file, so
+# they can be written to without changing the file. The parts not written to yet still come from the file, so they
+# change if the file is written again. With copy the arrays are copied out of the file and it is closed again.
+def read(path, copy=False):
+    with open(path, "rb") as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    magic, version, length = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} snapshot")
+
+    description = json.loads(data[HEADER.size:HEADER.size + length])
+    start = align(HEADER.size + length)
+    arrays = {}
+
+    for name, dtype, shape, offset in description["arrays"]:
+        count = math.prod(shape)
+        if count == 0:
+            arrays[name] = numpy.zeros(shape, dtype=dtype)
+        else:
+            arrays[name] = numpy.frombuffer(data, dtype, count, start + offset).reshape(shape)
+            if copy:
+                arrays[name] = arrays[name].copy()
+
+    if copy:
+        data.close()
+
+    return arrays, description
+
+
+# Replaces the world, the bullets, the score, the spawning and the random numbers of the state with the snapshot.
+# The objects get new UIDs, state["player_uid"] is updated to match. See read() for copy.
+def load(path, state, copy=False):
+    arrays, description = read(path, copy)
+    tags = description["tags"]
+
+    extras = [{} for i in range(description["objects"])]
+
+    for i, (color, flags, tag) in enumerate(zip(arrays["colors"].tolist(), arrays["extraFlags"].tolist(),
+                                                arrays["tags"].tolist())):
+        if flags & HAS_COLOR:
+            extras[i]["color"] = tuple(color)
+        if flags & IS_SENSOR:
+            extras[i]["sensor"] = True
+        if tag >= 0:
+            extras[i]["tag"] = tags[tag]
+
+    for owner, colliderType, (x, y, a, b) in zip(arrays["colliderOwners"].tolist(), arrays["colliderTypes"].tolist(),
+                                                 arrays["colliderData"].tolist()):
+        if COLLIDER_TYPES[colliderType] == "circle":
+            collider = colliders.circle(a, (x, y))
+        else:
+            collider = colliders.aabb(a, b, (x, y))
+        extras[owner].setdefault("colliders", []).append(collider)
+
+    objects = world.World.fromArrays(arrays, extras)
+    state["objects"] = objects
+    if description["player"] >= 0:
+        state["player_uid"] = int(objects.uids[description["player"]])
+
+    state["bullets"].clear()
+    for position, velocity, flags in zip(arrays["bulletPosition"].tolist(), arrays["bulletVelocity"].tolist(),
+                                         arrays["bulletFlags"].tolist()):
+        bullet = state["bullets"].spawn(state["bullet_image"], position, velocity)
+        bullet["drawn"] = bool(flags & BULLET_DRAWN)
+        bullet["marked_for_removal"] = bool(flags & BULLET_MARKED_FOR_REMOVAL)
+
+    state["score"] = description["score"]
+    state["spawn_mode"] = description["spawn_mode"]
+    state.update(description["spawn_settings"])
+    state["spawn_timer"] = description["spawn_timer"]
+    state["wave"] = description["wave"]
+
+    state["spawn_queue"].clear()
+    ends = numpy.cumsum(arrays["waveLengths"]).tolist()
+    for start, end in zip([0] + ends, ends):
+        state["spawn_queue"].push({
+            "position": arrays["wavePosition"][start:end],
+            "velocity": arrays["waveVelocity"][start:end],
+            "radius": arrays["waveRadius"][start:end],
+            "color": arrays["waveColor"][start:end]
+        })
+
+    # JSON turned the tuples into lists
+    version, internal, gauss = description["rng"]
+    state["rng"].setstate((version, tuple(internal), gauss))
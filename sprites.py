@@ -0,0 +1,79 @@
+# Pre-rendered surfaces for things that would otherwise be drawn from scratch every frame.
+# Asteroids are blitted from circle sprites keyed by (radius, color) and text is rendered once per (text, font, color).
+# Both caches are bounded and throw out the least recently used surface when full.
+
+import collections
+
+import pygame
+
+
+class LruCache:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, create):
+        surface = self.entries.get(key)
+
+        if surface is None:
+            self.misses += 1
+            surface = create()
+            self.entries[key] = surface
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+
+        return surface
+
+    # Changes the capacity, throwing out the least recently used surfaces that no longer fit
+    def resize(self, capacity):
+        self.capacity = capacity
+        while len(self.entries) > capacity:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# Sized by main.reset_game_state() to fit every (radius, color) pair the spawn settings can produce, so big waves
+# don't keep throwing out sprites that are still on the screen
+circles = LruCache(128)
+texts = LruCache(64)
+
+
+def prepare(surface):
+    if pygame.display.get_init() and pygame.display.get_surface() is not None:
+        return surface.convert_alpha()
+    return surface
+
+
+def circle(radius, color):
+    radius = int(round(radius))
+
+    def create():
+        surface = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+        pygame.draw.circle(surface, color, (radius, radius), radius)
+        return prepare(surface)
+
+    return circles.get((radius, tuple(color)), create)
+
+
+def draw_circle(screen, color, position, radius):
+    sprite = circle(radius, color)
+    return screen.blit(sprite, (position[0] - sprite.get_width() / 2, position[1] - sprite.get_height() / 2))
+
+
+def text(string, font, color):
+    return texts.get((string, font, tuple(color)), lambda: font.render(string, True, color))
+
+
+def clear():
+    circles.clear()
+    texts.clear()
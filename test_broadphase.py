@@ -0,0 +1,54 @@
+import random
+
+import numpy
+import pytest
+
+import broadphase
+
+
+def random_boxes(seed, count):
+    rng = random.Random(seed)
+    boxes = []
+
+    for i in range(count):
+        x, y = rng.uniform(-500, 500), rng.uniform(-500, 500)
+        width, height = rng.uniform(0, 60), rng.uniform(0, 60)
+        if rng.random() < 0.05:
+            width *= 10  # A few long ones, like fast objects swept over a step
+        boxes.append((x, y, x + width, y + height))
+
+    return boxes
+
+
+@pytest.mark.parametrize("method", list(broadphase.METHODS))
+@pytest.mark.parametrize("seed, count", [(0, 0), (1, 1), (2, 50), (3, 400)])
+def test_array_methods_match_brute_force(method, seed, count):
+    boxes = random_boxes(seed, count)
+    expected = broadphase.findPairsBruteForce(boxes)
+
+    first, second = broadphase.findPairsArray(numpy.array(boxes, dtype=float).reshape(-1, 4), method)
+
+    assert list(zip(first.tolist(), second.tolist())) == expected
+    assert broadphase.findPairs(boxes, method) == expected
+
+
+def test_query_many_matches_overlaps():
+    boxes = random_boxes(4, 300)
+    array = numpy.array(boxes)
+    queries = array[::7]
+
+    found, box = broadphase.queryManyArray(array, queries)
+
+    assert sorted(zip(found.tolist(), box.tolist())) == [
+        (i, j) for i in range(len(queries)) for j in range(len(boxes)) if broadphase.overlaps(tuple(queries[i]), boxes[j])]
+
+
+@pytest.mark.parametrize("cellSize", [5, 40, 1000])
+def test_query_many_grid_matches_query_many(cellSize):
+    array = numpy.array(random_boxes(5, 300))
+    queries = numpy.array(random_boxes(6, 100))
+
+    found, box = broadphase.queryManyGridArray(array, queries, cellSize)
+
+    assert list(zip(found.tolist(), box.tolist())) == sorted(zip(*(a.tolist() for a in
+                                                                   broadphase.queryManyArray(array, queries))))
@@ -0,0 +1,213 @@
+import math
+import random
+
+import numpy
+import pygame
+import pytest
+
+import colliders
+import physics
+import world
+
+
+def make_circle(position, velocity, radius=10, mass=None):
+    return {
+        "position": pygame.Vector2(position),
+        "velocity": pygame.Vector2(velocity),
+        "mass": radius**3 if mass is None else mass,
+        "radius": radius,
+        "colliders": [colliders.circle(radius)]
+    }
+
+
+def make_world(objects):
+    result = world.World()
+    for obj in objects:
+        result.add(obj)
+    return result
+
+
+def kinetic_energy(objects):
+    return sum(0.5 * obj["mass"] * pygame.Vector2(obj["velocity"]).length_squared() for obj in objects.values())
+
+
+def momentum(objects):
+    return sum((obj["mass"] * pygame.Vector2(obj["velocity"]) for obj in objects.values()), pygame.Vector2(0, 0))
+
+
+def test_solve_collisions_matches_solve_collision():
+    rng = random.Random(0)
+    collisions = []
+
+    for i in range(200):
+        displacement = pygame.Vector2(rng.uniform(-5, 5), rng.uniform(-5, 5))
+        collisions.append([
+            {"velocity": pygame.Vector2(rng.uniform(-300, 300), rng.uniform(-300, 300)),
+             "mass": rng.uniform(1, 1000), "displacement": displacement},
+            {"velocity": pygame.Vector2(rng.uniform(-300, 300), rng.uniform(-300, 300)),
+             "mass": rng.uniform(1, 1000), "displacement": -displacement}
+        ])
+
+    velocity1, velocity2 = physics.solveCollisions(
+        numpy.array([tuple(collision[0]["velocity"]) for collision in collisions]),
+        numpy.array([tuple(collision[1]["velocity"]) for collision in collisions]),
+        numpy.array([collision[0]["mass"] for collision in collisions]),
+        numpy.array([collision[1]["mass"] for collision in collisions]),
+        numpy.array([tuple(collision[0]["displacement"]) for collision in collisions]))
+
+    for i, collision in enumerate(collisions):
+        expected1, expected2 = physics.solveCollision(collision)
+        assert tuple(velocity1[i]) == pytest.approx(tuple(expected1))
+        assert tuple(velocity2[i]) == pytest.approx(tuple(expected2))
+
+
+# A lone contact gets the full elastic response, the same as solveCollision() gives
+def test_apply_collisions_single_contact_matches_solve_collision():
+    rng = random.Random(1)
+
+    for i in range(50):
+        objects = make_world([make_circle((0, 0), (rng.uniform(-200, 200), rng.uniform(-200, 200)),
+                                          rng.uniform(5, 20)),
+                              make_circle((rng.uniform(-15, 15), rng.uniform(-15, 15)),
+                                          (rng.uniform(-200, 200), rng.uniform(-200, 200)), rng.uniform(5, 20))])
+        (uid1, obj1), (uid2, obj2) = objects.items()
+        collisions = physics.findCollisionsBetween(uid1, obj1, uid2, obj2)
+        if not collisions:
+            continue
+
+        expected = physics.solveCollision([{**side, "velocity": pygame.Vector2(side["velocity"])}
+                                           for side in collisions[0]])
+        approaching = collisions[0][0]["displacement"].dot(obj1["velocity"].copy() - obj2["velocity"].copy()) < 0
+
+        physics.applyCollisions(objects, collisions)
+
+        if approaching:
+            assert tuple(obj1["velocity"]) == pytest.approx(tuple(expected[0]))
+            assert tuple(obj2["velocity"]) == pytest.approx(tuple(expected[1]))
+
+
+# A circle in several contacts at once, where adding up the full response of every contact would bounce it back
+# several times over: hit from three sides, squeezed between two others, and running into two others at an angle
+@pytest.mark.parametrize("center_velocity, directions, velocity", [
+    ((50, -20), [0, 120, 240], -100),
+    ((200, 0), [0, 180], -100),
+    ((200, 0), [0, 90, 180], -100),
+    ((200, 0), [-45, 45], 0)
+])
+def test_apply_collisions_several_contacts_conserve_momentum_and_energy(center_velocity, directions, velocity):
+    objects = [make_circle((0, 0), center_velocity)]
+    for i, angle in enumerate(directions):
+        direction = pygame.Vector2(1, 0).rotate(angle)
+        objects.append(make_circle(direction * 19, direction * velocity, 10 + 2 * i))
+    objects = make_world(objects)
+
+    collisions = []
+    items = list(objects.items())
+    for i, (uid1, obj1) in enumerate(items):
+        for uid2, obj2 in items[i + 1:]:
+            collisions += physics.findCollisionsBetween(uid1, obj1, uid2, obj2)
+    assert len(collisions) == len(directions)
+
+    energy = kinetic_energy(objects)
+    before = momentum(objects)
+
+    physics.applyCollisions(objects, collisions)
+
+    assert tuple(momentum(objects)) == pytest.approx(tuple(before), abs=1e-6)
+    assert kinetic_energy(objects) <= energy * (1 + 1e-9)
+
+
+# A world.World tests its single circles in batches and everything else one pair at a time, and finds the same
+# collisions as a dictionary of the same objects
+@pytest.mark.parametrize("seed", range(3))
+def test_world_collisions_match_dict_collisions(seed):
+    results = []
+
+    for make in (dict, make_world):
+        rng = random.Random(seed)
+        objects = []
+
+        for i in range(200):
+            r = rng.uniform(5, 20)
+            obj = make_circle((rng.uniform(0, 800), rng.uniform(0, 600)),
+                              (rng.uniform(-2000, 2000), rng.uniform(-2000, 2000)), r)
+            shape = i % 5
+            if shape == 1:
+                obj["colliders"] = [colliders.circle(r, (3, 1))]
+            elif shape == 2:
+                obj["colliders"] = [colliders.aabb(2 * r, r)]
+            elif shape == 3:
+                obj["colliders"] = [colliders.circle(r / 2, (r / 2, 0)), colliders.circle(r / 2, (-r / 2, 0))]
+            elif shape == 4 and rng.random() < 0.5:
+                obj["sensor"] = True
+            objects.append(obj)
+
+        objects = make(enumerate(objects)) if make is dict else make(objects)
+        bounds = pygame.Rect(0, 0, 800, 600)
+        index = physics.buildIndex(objects, 1 / 60, bounds)
+
+        results.append(([impact[:3] + (tuple(impact[3]),) for impact in physics.findTimesOfImpact(objects, 1 / 60,
+                                                                                                   index=index)],
+                        [(collision[0]["uid"], collision[1]["uid"], tuple(collision[0]["displacement"]))
+                         for collision in physics.findObjectCollisions(objects, index=index)]))
+
+    assert results[0] == results[1]
+
+
+# The world solver finds the same contact islands as the dict one
+def test_label_islands_matches_find_islands():
+    rng = random.Random(3)
+    slots1 = numpy.array([rng.randrange(100) for i in range(120)])
+    slots2 = numpy.array([rng.randrange(-1, 100) if i % 4 else -1 for i in range(120)])
+    slots2[slots1 == slots2] = -1
+
+    collisions = [[{"uid": int(slot1)}, {"uid": int(slot2)}] for slot1, slot2 in zip(slots1, slots2)]
+    labels = physics.labelIslands(slots1, slots2, 100)
+
+    for island in physics.findIslands(collisions):
+        contacts = [i for i, collision in enumerate(collisions) if any(collision is other for other in island)]
+        assert len(set(labels[contacts])) == 1
+        assert numpy.count_nonzero(labels == labels[contacts[0]]) == len(island)
+
+
+# A crowded box of circles and boxes bouncing around doesn't gain energy
+def test_dense_world_does_not_gain_energy():
+    rng = random.Random(2)
+    objects = world.World()
+
+    for i in range(150):
+        r = rng.uniform(10, 25)
+        obj = make_circle((rng.uniform(r, 800 - r), rng.uniform(r, 600 - r)),
+                          (rng.uniform(-200, 200), rng.uniform(-200, 200)), r)
+        if i % 2:
+            obj["colliders"] = [colliders.aabb(2 * r, 2 * r)]
+        objects.add(obj)
+
+    bounds = pygame.Rect(0, 0, 800, 600)
+    energy = kinetic_energy(objects)
+
+    for step in range(60):
+        physics.update(1 / 60, objects, bounds, None, continuous=False)
+
+    assert kinetic_energy(objects) <= energy * 1.01
+    assert max(math.hypot(*obj["velocity"]) for obj in objects.values()) < 1000
+
+
+# Objects bounced at their time of impact move on along a new path, which the broadphases have to pick up too
+@pytest.mark.parametrize("seed", range(5))
+def test_broadphases_agree_with_continuous_collisions(seed):
+    results = []
+
+    for method in ("grid", "sweep", "bruteforce"):
+        rng = random.Random(seed)
+        objects = make_world([make_circle((rng.uniform(0, 800), rng.uniform(0, 600)),
+                                          (rng.uniform(-3000, 3000), rng.uniform(-3000, 3000)), rng.uniform(5, 20))
+                              for i in range(250)])
+
+        collisions = physics.update(1 / 60, objects, pygame.Rect(0, 0, 800, 600), None, method, continuous=True)
+
+        results.append(([(collision[0]["uid"], collision[1]["uid"]) for collision in collisions],
+                        [(tuple(obj["position"]), tuple(obj["velocity"])) for obj in objects.values()]))
+
+    assert results[0] == results[2]
+    assert results[1] == results[2]
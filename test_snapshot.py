@@ -0,0 +1,36 @@
+import numpy
+
+import headless
+import main
+import physics
+import snapshot
+import world
+
+
+def copy_arrays(objects):
+    return {name: getattr(objects, name)[:objects.count].copy() for name in world.World.ARRAYS}
+
+
+# A quick save over the snapshot the game was loaded from must not change the loaded world
+def test_save_over_loaded_snapshot(tmp_path):
+    path = str(tmp_path / "quicksave.bin")
+
+    headless.start(1, mode="stress")
+    for frame in range(200):
+        headless.advance({}, False)
+    snapshot.save(path, main.state)
+
+    # Only the physics, spawning more objects would move the world into new arrays
+    main.load_snapshot(path)
+    for frame in range(30):
+        physics.update(main.state["dt"], main.state["objects"], main.state["bounds"], None)
+
+    main.state["score"] += 10**12  # Moves the arrays in the file
+    before = copy_arrays(main.state["objects"])
+    snapshot.save(path, main.state)
+
+    for name, array in copy_arrays(main.state["objects"]).items():
+        assert numpy.array_equal(array, before[name]), name
+
+    for frame in range(30):
+        headless.advance({}, False)
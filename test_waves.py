@@ -0,0 +1,42 @@
+import numpy
+import pytest
+
+import broadphase
+import waves
+import world
+
+
+def get_boxes(position, radius):
+    return numpy.concatenate((position - radius[:, None], position + radius[:, None]), axis=1)
+
+
+@pytest.mark.parametrize("mode", ["endless", "stress"])
+def test_generated_waves_dont_overlap(mode):
+    settings = waves.MODES[mode]
+    wave = waves.generate(0, settings["max_wave_size"], 800, settings["min_radius"], settings["max_radius"], 4)
+
+    first, second = broadphase.findPairsArray(get_boxes(wave["position"], wave["radius"]))
+
+    assert len(first) == 0
+    assert numpy.all(wave["position"][:, 1] + wave["radius"] <= waves.SPAWN_HEIGHT + settings["max_radius"])
+
+
+# Asteroids are only added where they don't overlap the world or each other, the others wait
+def test_placed_asteroids_dont_overlap():
+    objects = world.World()
+    queue = waves.SpawnQueue()
+    settings = waves.MODES["stress"]
+
+    for seed in range(3):
+        wave = waves.generate(seed, 600, 800, settings["min_radius"], settings["max_radius"], 4)
+        wave["position"][:, 1] += 7 * seed  # Waves on top of each other
+        queue.push(wave)
+
+    added = 0
+    while len(queue):
+        added += len(queue.place(objects, ["red", "green", "blue", "white"]))
+
+        slots, boxes = objects.getBoxes()
+        assert len(broadphase.findPairsArray(boxes)[0]) == 0
+
+    assert added == len(objects) == 1800
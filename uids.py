@@ -0,0 +1,55 @@
+# Hands out object UIDs in constant time and recycles the freed ones.
+# A UID packs a slot index and a generation: uid = generation << INDEX_BITS | index. Every time an index is freed its
+# generation goes up, so an old UID that is still lying around somewhere (in a queued collision event, in
+# state["dragObject"], ...) never matches the object that reuses the index and isAlive() catches it.
+# UIDs are never negative, so -1 can still be used to mean "no object".
+
+import collections
+
+INDEX_BITS = 20
+INDEX_MASK = (1 << INDEX_BITS) - 1
+
+
+def getIndex(uid):
+    return uid & INDEX_MASK
+
+
+def getGeneration(uid):
+    return uid >> INDEX_BITS
+
+
+class UidAllocator:
+    def __init__(self):
+        self.generations = []  # index -> current generation
+        self.live = []  # index -> whether the UID with the current generation is in use
+        self.free = collections.deque()  # Freed indices, reused oldest first so generations wrap around slowly
+
+    def allocate(self):
+        if self.free:
+            index = self.free.popleft()
+        else:
+            index = len(self.generations)
+            if index > INDEX_MASK:
+                raise OverflowError(f"More than {INDEX_MASK + 1} UIDs in use")
+            self.generations.append(0)
+            self.live.append(False)
+
+        self.live[index] = True
+        return self.generations[index] << INDEX_BITS | index
+
+    def release(self, uid):
+        if not self.isAlive(uid):
+            raise KeyError(f"UID {uid} is not in use")
+
+        index = getIndex(uid)
+        self.live[index] = False
+        self.generations[index] += 1
+        self.free.append(index)
+
+    def isAlive(self, uid):
+        index = getIndex(uid)
+        return 0 <= uid and index < len(self.generations) and self.live[index] and \
+            self.generations[index] == getGeneration(uid)
+
+    def __len__(self):
+        return len(self.generations) - len(self.free)
@@ -0,0 +1,171 @@
+# Asteroid spawning in waves.
+# Every time the spawn timer runs out a wave of asteroids is generated in one go with NumPy: positions above the top
+# of the screen, radii, velocities and colors. The waves wait in a SpawnQueue, which adds at most SPAWN_BUDGET
+# asteroids per frame, so even a wave of thousands doesn't stall a frame.
+# The band above the screen a wave fills is split into cells as wide as the largest asteroid and every asteroid gets a
+# cell of its own, so the asteroids of a wave never overlap each other. They are still only added where they don't
+# overlap anything already in the world, which is checked for the whole batch of a frame at once with the array
+# grid query from broadphase.py. One that would overlap is moved further up and tried again next frame.
+#
+# How the game gets harder is set by the mode. The spawn interval, the size of the waves and the radii follow linear
+# curves over the waves, all of them plain state values so the batch runner can override them with --set:
+#   spawn interval = max(min_spawn_interval, spawn_interval - spawn_interval_decay * wave), in milliseconds
+#   wave size = min(max_wave_size, wave_size + wave_size_growth * wave)
+
+import numpy
+
+import broadphase
+import colliders
+import world
+
+MODES = {
+    # The original game, one asteroid at a time
+    "classic": {
+        "spawn_interval": 3000,  # Initial interval in milliseconds
+        "spawn_interval_decay": 50,  # How much the interval shrinks after every wave, in milliseconds
+        "min_spawn_interval": 500,
+        "wave_size": 1,
+        "wave_size_growth": 0,  # How many more asteroids every wave has than the one before
+        "max_wave_size": 1,
+        "min_radius": 10,
+        "max_radius": 100,
+        "max_circles": 8  # Maximum number of asteroids in the game, counting the ones still waiting to be added
+    },
+    # Waves that keep getting bigger
+    "endless": {
+        "spawn_interval": 5000,
+        "spawn_interval_decay": 50,
+        "min_spawn_interval": 2000,
+        "wave_size": 3,
+        "wave_size_growth": 1,
+        "max_wave_size": 100,
+        "min_radius": 10,
+        "max_radius": 60,
+        "max_circles": 1000
+    },
+    # Thousands of small asteroids, for stress testing
+    "stress": {
+        "spawn_interval": 1000,
+        "spawn_interval_decay": 0,
+        "min_spawn_interval": 1000,
+        "wave_size": 500,
+        "wave_size_growth": 500,
+        "max_wave_size": 5000,
+        "min_radius": 4,
+        "max_radius": 12,
+        "max_circles": 20000
+    }
+}
+
+SPAWN_BUDGET = 250  # The most asteroids added per frame
+SPAWN_HEIGHT = -50  # Where the lowest asteroids of a wave are, same as single asteroids have always spawned
+OCCUPANCY = 0.5  # How many of the cells of the band above the screen get an asteroid
+
+
+def get_wave_size(state, wave):
+    return int(min(state["max_wave_size"], state["wave_size"] + state["wave_size_growth"] * wave))
+
+
+# A wave of count asteroids as arrays, drawn from the seed. Every asteroid sits somewhere in its own cell of a band
+# above the screen, which is as many rows of cells high as it takes to leave the rest of the cells empty.
+def generate(seed, count, width, minRadius, maxRadius, colorCount):
+    rng = numpy.random.default_rng(seed)
+
+    radius = rng.integers(minRadius, maxRadius, count, endpoint=False).astype(float)
+
+    cellSize = 2 * maxRadius
+    columns = max(int((width - 100) // cellSize), 1)
+    rows = max(int(numpy.ceil(count / columns / OCCUPANCY)), 1)
+    cell = numpy.sort(rng.choice(rows * columns, count, replace=False))  # Bottom rows first, so a batch spans few rows
+
+    # How far an asteroid can be from the center of its cell
+    play = cellSize / 2 - radius
+
+    position = numpy.empty((count, 2))
+    position[:, 0] = (width - columns * cellSize) / 2 + (cell % columns + 0.5) * cellSize + rng.uniform(-play, play)
+    position[:, 1] = SPAWN_HEIGHT - cell // columns * cellSize + rng.uniform(-play, play)
+
+    velocity = numpy.empty((count, 2))
+    velocity[:, 0] = rng.uniform(-100, 100, count)
+    velocity[:, 1] = rng.uniform(50, 200, count)
+
+    return {
+        "position": position,
+        "velocity": velocity,
+        "radius": radius,
+        "color": rng.integers(0, colorCount, count)
+    }
+
+
+class SpawnQueue:
+    def __init__(self):
+        self.waves = []  # What is left of the generated waves, oldest first
+
+    def push(self, wave):
+        self.waves.append(wave)
+
+    def clear(self):
+        self.waves = []
+
+    def __len__(self):
+        return sum(len(wave["radius"]) for wave in self.waves)
+
+    # Adds up to budget asteroids to the world from the front of the queue. Returns their UIDs.
+    def place(self, objects, colors, budget=SPAWN_BUDGET):
+        if not self.waves:
+            return []
+
+        wave = self.waves[0]
+        batch = {name: array[:budget] for name, array in wave.items()}
+        position = batch["position"]
+        radius = batch["radius"]
+
+        box = numpy.empty((len(radius), 4))
+        box[:, :2] = position - radius[:, None]
+        box[:, 2:] = position + radius[:, None]
+
+        # Everything already in the band the asteroids go to
+        band = (float(numpy.min(box[:, 0])), float(numpy.min(box[:, 1])),
+                float(numpy.max(box[:, 2])), float(numpy.max(box[:, 3])))
+        slots, boxes = objects.getBoxes(0, band)
+
+        blocked = numpy.zeros(len(radius), dtype=bool)
+        blocked[broadphase.queryManyGridArray(boxes, box, 2 * float(numpy.max(radius)))[0]] = True
+        # Asteroids moved up in an earlier frame can overlap others of the same wave, then the later one waits
+        blocked[broadphase.findPairsArray(box, "sweep")[1]] = True
+
+        position[blocked, 1] -= 2 * radius[blocked]  # Try again a bit higher next frame
+        placed = numpy.flatnonzero(~blocked)
+
+        uids = self.add(objects, batch, placed, colors)
+
+        # The ones that didn't fit are moved to the end of the wave
+        for name, array in wave.items():
+            wave[name] = numpy.concatenate((array[budget:], batch[name][blocked]))
+
+        if len(wave["radius"]) == 0:
+            self.waves.pop(0)
+
+        return uids
+
+    def add(self, objects, batch, placed, colors):
+        radius = batch["radius"][placed]
+        n = len(radius)
+
+        extent = numpy.empty((n, 4))
+        extent[:, :2] = -radius[:, None]
+        extent[:, 2:] = radius[:, None]
+
+        arrays = {
+            "position": batch["position"][placed],
+            "velocity": batch["velocity"][placed],
+            "mass": radius ** 3,  # With constant density mass is proportional to radius cubed
+            "radius": radius,
+            "extent": extent,
+            "flags": world.HAS_VELOCITY | world.HAS_MASS | world.HAS_RADIUS | world.HAS_EXTENT | world.IS_CIRCLE
+        }
+
+        extras = [{"colliders": [colliders.circle(r)], "color": colors[color], "tag": "asteroid"}
+                  for r, color in zip(radius.tolist(), batch["color"][placed].tolist())]
+
+        return objects.addMany(arrays, extras)
@@ -0,0 +1,523 @@
+# Structure-of-arrays storage for the physics objects.
+# Positions, velocities, masses and radii live in contiguous NumPy arrays so that movement, speed capping and wall
+# reflection can run over every object at once instead of one pygame.Vector2 at a time.
+# The world still behaves like the old {uid: {"position": ..., ...}} dictionary, so objects[uid]["position"].x = 5
+# and friends keep working through a thin view layer.
+
+from collections.abc import MutableMapping
+
+import numpy
+import pygame
+
+import colliders
+import uids
+
+# Bit flags telling which of the array backed fields an object actually has
+HAS_VELOCITY = 1
+HAS_MASS = 2
+HAS_RADIUS = 4
+HAS_EXTENT = 8  # The object has colliders and their bounds are cached in World.extent
+IS_CIRCLE = 16  # The colliders are a single circle centered on the object, its radius is the right edge of the extent
+IS_BOX = 32  # The colliders are a single box centered on the object, the extent is the box
+IS_SENSOR = 64  # obj["sensor"] is set, see physics.checkObjectProperties()
+
+# Optional fields stored in the arrays, everything else except the position goes into a per-object dictionary
+VECTOR_FIELDS = {"velocity": HAS_VELOCITY}
+SCALAR_FIELDS = {"mass": HAS_MASS, "radius": HAS_RADIUS}
+
+
+# A live reference to one row of a vector array. Reads and writes go straight to the array.
+# Anything that doesn't modify the vector is done on a pygame.Vector2 copy.
+class VectorView:
+    __slots__ = ("world", "field", "uid")
+
+    def __init__(self, world, field, uid):
+        self.world = world
+        self.field = field
+        self.uid = uid
+
+    # Looked up on every access, because compacting or growing the world moves the rows around
+    def row(self):
+        return getattr(self.world, self.field)[self.world.slots[self.uid]]
+
+    def copy(self):
+        row = self.row()
+        return pygame.Vector2(float(row[0]), float(row[1]))
+
+    def update(self, value):
+        row = self.row()
+        row[0] = value[0]
+        row[1] = value[1]
+
+    @property
+    def x(self):
+        return float(self.row()[0])
+
+    @x.setter
+    def x(self, value):
+        self.row()[0] = value
+
+    @property
+    def y(self):
+        return float(self.row()[1])
+
+    @y.setter
+    def y(self, value):
+        self.row()[1] = value
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, index):
+        return float(self.row()[index])
+
+    def __setitem__(self, index, value):
+        self.row()[index] = value
+
+    def __iter__(self):
+        row = self.row()
+        return iter((float(row[0]), float(row[1])))
+
+    def __repr__(self):
+        return f"VectorView({self.x}, {self.y})"
+
+    def __eq__(self, other):
+        return self.copy() == other
+
+    def __neg__(self):
+        return -self.copy()
+
+    def __add__(self, other):
+        return self.copy() + other
+
+    def __radd__(self, other):
+        return other + self.copy()
+
+    def __sub__(self, other):
+        return self.copy() - other
+
+    def __rsub__(self, other):
+        return other - self.copy()
+
+    def __mul__(self, other):
+        return self.copy() * other
+
+    def __rmul__(self, other):
+        return other * self.copy()
+
+    def __truediv__(self, other):
+        return self.copy() / other
+
+    def __iadd__(self, other):
+        self.update(self.copy() + other)
+        return self
+
+    def __isub__(self, other):
+        self.update(self.copy() - other)
+        return self
+
+    def __imul__(self, other):
+        self.update(self.copy() * other)
+        return self
+
+    def scale_to_length(self, length):
+        vector = self.copy()
+        vector.scale_to_length(length)
+        self.update(vector)
+
+    def normalize_ip(self):
+        self.update(self.copy().normalize())
+
+    # length(), normalize(), dot() etc.
+    def __getattr__(self, name):
+        return getattr(self.copy(), name)
+
+
+# What objects[uid] returns. Array backed fields are read from and written to the world, the rest is kept in a
+# plain dictionary.
+class ObjectView(MutableMapping):
+    __slots__ = ("world", "uid")
+
+    def __init__(self, world, uid):
+        self.world = world
+        self.uid = uid
+
+    def __getitem__(self, key):
+        world = self.world
+        slot = world.slots[self.uid]
+
+        if key == "position":
+            return VectorView(world, key, self.uid)
+        if key in VECTOR_FIELDS:
+            if not world.flags[slot] & VECTOR_FIELDS[key]:
+                raise KeyError(key)
+            return VectorView(world, key, self.uid)
+        if key in SCALAR_FIELDS:
+            if not world.flags[slot] & SCALAR_FIELDS[key]:
+                raise KeyError(key)
+            return getattr(world, key)[slot].item()
+
+        return world.extras[slot][key]
+
+    def __setitem__(self, key, value):
+        world = self.world
+        slot = world.slots[self.uid]
+
+        if key == "position":
+            world.position[slot] = (value[0], value[1])
+        elif key in VECTOR_FIELDS:
+            world.velocity[slot] = (value[0], value[1])
+            world.flags[slot] |= VECTOR_FIELDS[key]
+        elif key in SCALAR_FIELDS:
+            getattr(world, key)[slot] = value
+            world.flags[slot] |= SCALAR_FIELDS[key]
+        else:
+            world.extras[slot][key] = value
+
+            if key == "colliders":
+                world.updateExtent(slot)
+            elif key == "sensor":
+                world.setFlag(slot, IS_SENSOR, value)
+
+    def __delitem__(self, key):
+        world = self.world
+        slot = world.slots[self.uid]
+
+        if key == "position":
+            raise KeyError("Every object must have a position")
+        if key in VECTOR_FIELDS or key in SCALAR_FIELDS:
+            flag = VECTOR_FIELDS.get(key) or SCALAR_FIELDS[key]
+            if not world.flags[slot] & flag:
+                raise KeyError(key)
+            world.flags[slot] &= numpy.uint8(~flag & 0xFF)
+            getattr(world, key)[slot] = 0
+        else:
+            del world.extras[slot][key]
+
+            if key == "colliders":
+                world.updateExtent(slot)
+            elif key == "sensor":
+                world.setFlag(slot, IS_SENSOR, False)
+
+    def __iter__(self):
+        world = self.world
+        slot = world.slots[self.uid]
+
+        yield "position"
+        for key, flag in VECTOR_FIELDS.items():
+            if world.flags[slot] & flag:
+                yield key
+        for key, flag in SCALAR_FIELDS.items():
+            if world.flags[slot] & flag:
+                yield key
+        yield from world.extras[slot]
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    # Answered from the flags and the extras without building the value, the physics asks this for every pair
+    def __contains__(self, key):
+        world = self.world
+        slot = world.slots[self.uid]
+
+        if key == "position":
+            return True
+        if key in VECTOR_FIELDS:
+            return bool(world.flags[slot] & VECTOR_FIELDS[key])
+        if key in SCALAR_FIELDS:
+            return bool(world.flags[slot] & SCALAR_FIELDS[key])
+        return key in world.extras[slot]
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __repr__(self):
+        return f"ObjectView({self.uid}, {dict(self)})"
+
+
+class World(MutableMapping):
+    # The per-slot arrays that describe the objects, see getArrays()
+    ARRAYS = ("position", "velocity", "mass", "radius", "extent", "flags")
+
+    def __init__(self, capacity=64):
+        self.position = numpy.zeros((capacity, 2))
+        self.velocity = numpy.zeros((capacity, 2))
+        self.mass = numpy.zeros(capacity)
+        self.radius = numpy.zeros(capacity)
+        self.extent = numpy.zeros((capacity, 4))  # Bounds of the colliders relative to the position, (minX, minY, maxX, maxY)
+        self.flags = numpy.zeros(capacity, dtype=numpy.uint8)
+        self.alive = numpy.zeros(capacity, dtype=bool)
+        self.uids = numpy.full(capacity, -1, dtype=numpy.int64)
+        self.extras = [None] * capacity
+
+        self.count = 0  # Slots [0, count) have been used, some of them may be free again
+        self.slots = {}  # uid -> slot
+        self.free = []  # Slots below count that can be reused
+        self.allocator = uids.UidAllocator()
+
+    def grow(self):
+        capacity = len(self.alive) * 2
+
+        for name in self.ARRAYS + ("alive", "uids"):
+            old = getattr(self, name)
+            new = numpy.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+        self.uids[self.count:] = -1
+        self.extras += [None] * (capacity - len(self.extras))
+
+    # Moves the live objects to the front of the arrays, keeping their order, and empties the free list
+    def compact(self):
+        live = numpy.flatnonzero(self.alive[:self.count])
+        n = len(live)
+
+        for name in self.ARRAYS + ("uids",):
+            array = getattr(self, name)
+            array[:n] = array[live]
+
+        self.extras[:n] = [self.extras[slot] for slot in live]
+        self.extras[n:self.count] = [None] * (self.count - n)
+        self.alive[:n] = True
+        self.alive[n:self.count] = False
+        self.uids[n:self.count] = -1
+        self.flags[n:self.count] = 0
+
+        self.count = n
+        self.free = []
+        self.slots = {int(uid): slot for slot, uid in enumerate(self.uids[:n])}
+
+    # The live objects as a dictionary of ARRAYS, one row per object, and the list of their other fields.
+    # Along with the UIDs of the objects, all in slot order.
+    def getArrays(self):
+        live = numpy.flatnonzero(self.alive[:self.count])
+        arrays = {name: getattr(self, name)[live] for name in self.ARRAYS}
+
+        return arrays, [self.extras[slot] for slot in live], self.uids[live]
+
+    # A new world with the objects from getArrays(), in the same order but with new UIDs.
+    # The arrays are used as they are without copying, so they can be views of a memory mapped file. They have to be
+    # writable and all have the same length. Growing the world later replaces them with copies.
+    @classmethod
+    def fromArrays(cls, arrays, extras):
+        n = len(extras)
+        world = cls(capacity=max(n, 1))
+        if n == 0:
+            return world
+
+        for name in cls.ARRAYS:
+            setattr(world, name, arrays[name])
+
+        world.alive = numpy.ones(n, dtype=bool)
+        world.uids = numpy.array([world.allocator.allocate() for i in range(n)], dtype=numpy.int64)
+        world.extras = list(extras)
+        world.count = n
+        world.slots = {uid: slot for slot, uid in enumerate(world.uids.tolist())}
+
+        return world
+
+    # Adds a new object and returns its UID
+    def add(self, obj):
+        uid = self.allocator.allocate()
+
+        if self.free:
+            slot = self.free.pop()
+        else:
+            if self.count == len(self.alive):
+                self.grow()
+            slot = self.count
+            self.count += 1
+
+        self.slots[uid] = slot
+        self.uids[slot] = uid
+        self.alive[slot] = True
+        self.store(uid, obj)
+
+        return uid
+
+    # Adds many objects at once and returns their UIDs. The array fields are given as arrays with a row per object, by
+    # their names in ARRAYS, and everything else as a list of dictionaries. The flags and the extent have to match the
+    # fields and colliders given, missing arrays are left at zero.
+    def addMany(self, arrays, extras):
+        n = len(extras)
+        while self.count + n > len(self.alive):
+            self.grow()
+
+        slots = slice(self.count, self.count + n)
+        for name in self.ARRAYS:
+            getattr(self, name)[slots] = arrays.get(name, 0)
+
+        newUids = [self.allocator.allocate() for i in range(n)]
+        self.uids[slots] = newUids
+        self.alive[slots] = True
+        self.extras[slots] = extras
+        self.slots.update(zip(newUids, range(self.count, self.count + n)))
+        self.count += n
+
+        return newUids
+
+    # Replaces the contents of an existing object. New objects get their UID from add().
+    def __setitem__(self, uid, obj):
+        if uid not in self.slots:
+            raise KeyError(f"UID {uid} doesn't belong to this world, add new objects with World.add()")
+
+        self.store(uid, obj)
+
+    def store(self, uid, obj):
+        slot = self.slots[uid]
+
+        self.flags[slot] = 0
+        self.position[slot] = 0
+        self.velocity[slot] = 0
+        self.mass[slot] = 0
+        self.radius[slot] = 0
+        self.extent[slot] = 0
+        self.extras[slot] = {}
+
+        view = ObjectView(self, uid)
+        for key, value in obj.items():
+            view[key] = value
+
+    def setFlag(self, slot, flag, value):
+        if value:
+            self.flags[slot] |= flag
+        else:
+            self.flags[slot] &= numpy.uint8(~flag & 0xFF)
+
+    # Caches the bounds of the object's colliders and whether they are a single centered circle or box, which the
+    # physics can test in batches. Called whenever obj["colliders"] is set, so a collider list that is changed in place
+    # has to be set again for the cache to follow.
+    def updateExtent(self, slot):
+        colliderList = self.extras[slot].get("colliders")
+        single = colliderList[0] if colliderList and len(colliderList) == 1 and \
+            colliderList[0]["position"] == (0, 0) else None
+
+        if colliderList:
+            self.extent[slot] = colliders.getObjectBounds(colliderList, pygame.Vector2(0, 0))
+        else:
+            self.extent[slot] = 0
+
+        self.setFlag(slot, HAS_EXTENT, colliderList)
+        self.setFlag(slot, IS_CIRCLE, single is not None and colliders.isCircle(single))
+        self.setFlag(slot, IS_BOX, single is not None and not colliders.isCircle(single))
+
+    def __getitem__(self, uid):
+        if uid not in self.slots:
+            raise KeyError(uid)
+
+        return ObjectView(self, uid)
+
+    def __delitem__(self, uid):
+        slot = self.slots.pop(uid)
+        self.allocator.release(uid)
+
+        self.alive[slot] = False
+        self.flags[slot] = 0
+        self.velocity[slot] = 0
+        self.uids[slot] = -1
+        self.extras[slot] = None
+        self.free.append(slot)
+
+        # Keep the batch operations from wading through mostly dead slots
+        if len(self.free) > 16 and len(self.free) * 2 > self.count:
+            self.compact()
+
+    def __iter__(self):
+        for slot in range(self.count):
+            if self.alive[slot]:
+                yield int(self.uids[slot])
+
+    def __len__(self):
+        return len(self.slots)
+
+    # False for UIDs of objects that have been removed, even if their index has been handed out again since
+    def __contains__(self, uid):
+        return uid in self.slots
+
+    # The live slots that have every one of the given flags
+    def mask(self, flags=0):
+        mask = self.alive[:self.count]
+        if flags:
+            mask = mask & (self.flags[:self.count] & flags == flags)
+        return mask
+
+    ################################
+    # Batch operations
+
+    def integrate(self, dt):
+        mask = self.mask(HAS_VELOCITY)
+        self.position[:self.count][mask] += self.velocity[:self.count][mask] * dt
+
+    # The positions by slot, blended from the previous positions and UIDs saved from position and uids to the current
+    # ones by alpha. Objects that weren't in the same slot back then are at their current position.
+    def interpolate(self, previousPositions, previousUids, alpha):
+        n = min(self.count, len(previousUids))
+        positions = self.position[:self.count].copy()
+
+        same = numpy.flatnonzero(self.uids[:n] == previousUids[:n])
+        positions[same] = previousPositions[same] + (positions[same] - previousPositions[same]) * alpha
+
+        return positions
+
+    def capSpeed(self, maxSpeed):
+        velocity = self.velocity[:self.count]
+        speed = numpy.hypot(velocity[:, 0], velocity[:, 1])
+        mask = self.mask(HAS_VELOCITY) & (speed > maxSpeed)
+        velocity[mask] *= (maxSpeed / speed[mask])[:, None]
+
+    # The bounds of the colliders of every object that has them, swept over the movement during dt.
+    # With a region (left, top, right, bottom) only the objects whose swept bounds overlap it are included.
+    # Returns the slots and an (n, 4) array of (minX, minY, maxX, maxY) rows, in slot order.
+    def getBoxes(self, dt=0, region=None):
+        mask = self.mask(HAS_EXTENT)
+        boxes = self.position[:self.count, [0, 1, 0, 1]] + self.extent[:self.count]
+
+        move = self.velocity[:self.count] * dt
+        boxes[:, :2] += numpy.minimum(move, 0)
+        boxes[:, 2:] += numpy.maximum(move, 0)
+
+        if region is not None:
+            mask = mask & (boxes[:, 0] <= region[2]) & (region[0] <= boxes[:, 2]) & \
+                (boxes[:, 1] <= region[3]) & (region[1] <= boxes[:, 3])
+
+        return numpy.flatnonzero(mask), boxes[mask]
+
+    # The objects with colliders, a velocity and a mass that stick out of the rectangle, as their slots and how far each
+    # of them has to move to get back inside. The object bounds come from the cached extents, so an object well inside
+    # the rectangle costs no more than a comparison.
+    # Objects entirely outside the rectangle that are moving towards it are inactive and left alone, so asteroids
+    # spawned above the screen drift in on their own.
+    def findWallPushes(self, left, top, right, bottom):
+        mask = self.mask(HAS_VELOCITY | HAS_MASS | HAS_EXTENT)
+        position = self.position[:self.count]
+        extent = self.extent[:self.count]
+        low = position + extent[:, :2]
+        high = position + extent[:, 2:]
+
+        # Positive where the object sticks out of the left or top wall, negative for the right or bottom wall.
+        # A collider sticking out of opposite walls gets pushed by the difference.
+        push = numpy.maximum((left, top) - low, 0) + numpy.minimum((right, bottom) - high, 0)
+
+        outside = (high[:, 0] < left) | (right < low[:, 0]) | (high[:, 1] < top) | (bottom < low[:, 1])
+        entering = outside & (numpy.einsum("ij,ij->i", push, self.velocity[:self.count]) > 0)
+
+        slots = numpy.flatnonzero(mask & ~entering & (numpy.einsum("ij,ij->i", push, push) >= 0.001))
+        return slots, push[slots]
+
+    # Pushes the objects found by findWallPushes() back inside the rectangle and mirrors the velocity components that
+    # point out of it. The walls are immovable, so this is the same as an elastic collision with an infinite mass.
+    # Returns the slots and pushes like findWallPushes().
+    def collideWithWalls(self, left, top, right, bottom):
+        slots, push = self.findWallPushes(left, top, right, bottom)
+        if len(slots) == 0:
+            return slots, push
+
+        # Move the objects away a bit more than just the displacement to avoid very small collisions
+        length = numpy.linalg.norm(push, axis=1)
+        self.position[slots] += push * ((length + 0.01) / length)[:, None]
+
+        velocity = self.velocity[slots]
+        velocity[push * velocity < 0] *= -1
+        self.velocity[slots] = velocity
+
+        return slots, push